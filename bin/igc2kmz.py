@@ -20,15 +20,21 @@
 import optparse
 import os
 import sys
+try:
+    from cStringIO import StringIO
+except ImportError:
+    from StringIO import StringIO
 
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
 
 from igc2kmz import Flight, flights2kmz
+from igc2kmz.cache import Cache
 from igc2kmz.gpx import GPX
 from igc2kmz.igc import IGC
 from igc2kmz.kml import Verbatim
 from igc2kmz.photo import Photo
 from igc2kmz.task import Task
+from igc2kmz.util import open_inputs, splitext
 from igc2kmz.xc import XC
 
 
@@ -37,19 +43,68 @@ from igc2kmz.xc import XC
 default_output = None
 
 
+def load_track(name, file, cache=None, windows=()):
+    """Load a track from file, using cache if it is given, analysing the extra
+    windows."""
+    ext = os.path.splitext(name)[1].lower()
+    if cache:
+        data = file.read()
+        key = cache.key(data, ext, windows)
+        # The same contents may be cached under another name, so rename the
+        # track as its parser would have named it
+        track = cache.get(key, os.path.basename(name) if ext == '.igc'
+                          else name)
+        if track:
+            return track
+        file = StringIO(data)
+    if ext == '.igc':
+        track = IGC(file, filename=name).track(windows=windows)
+    else:
+        track = GPX(file, filename=name).track(windows=windows)
+    if cache:
+        cache.put(key, track)
+    return track
+
+
 def add_flight(option, opt, value, parser):
-    """Add a flight."""
+    """Add a flight, or every flight in a zip archive."""
     global default_output
-    basename, ext = os.path.splitext(value)
+    basename, ext = splitext(value)
     if default_output is None:
         default_output = basename + '.kmz'
-    if ext.lower() == '.igc':
-        track = IGC(open(value)).track()
-    elif ext.lower() == '.gpx':
-        track = GPX(open(value)).track()
-    else:
+    if ext.lower() not in ('.igc', '.gpx', '.zip'):
         raise RuntimeError, 'unsupported file type %s' % repr(ext)
-    parser.values.flights.append(Flight(track))
+    cache = Cache(parser.values.cache) if parser.values.cache else None
+    windows = parser.values.windows
+    count = 0
+    for name, file in open_inputs(value, ('.igc', '.gpx')):
+        track = load_track(name, file, cache, windows)
+        parser.values.flights.append(Flight(track))
+        count += 1
+    if count == 0:
+        raise RuntimeError, 'no flights found in %s' % repr(value)
+
+
+def check_no_flights(opt, parser):
+    """Reject opt if it follows a flight, which it would not apply to."""
+    if parser.values.flights:
+        raise optparse.OptionValueError('%s must precede --igc' % opt)
+
+
+def set_cache(option, opt, value, parser):
+    """Set the track cache directory."""
+    check_no_flights(opt, parser)
+    parser.values.cache = value
+
+
+def set_windows(option, opt, value, parser):
+    """Set the extra analysis windows."""
+    check_no_flights(opt, parser)
+    try:
+        parser.values.windows = tuple(int(window)
+                                      for window in value.split(','))
+    except ValueError:
+        raise optparse.OptionValueError('invalid windows %s' % repr(value))
 
 
 def set_flight_option(option, opt, value, parser):
@@ -92,10 +147,20 @@ def main(argv):
             help='add root element')
     parser.add_option('-t', '--task', metavar='FILENAME',
             help='set task')
+    parser.add_option('--cache', metavar='DIRECTORY', type='string',
+            action='callback', callback=set_cache,
+            help='cache parsed tracks in DIRECTORY (must precede --igc)')
+    parser.add_option('--windows', metavar='SECONDS,...', type='string',
+            action='callback', callback=set_windows,
+            help='also color tracks over windows of SECONDS '
+                 '(must precede --igc)')
+    parser.add_option('--lod', action='store_true',
+            help='draw tracks more coarsely when zoomed out')
     group = optparse.OptionGroup(parser, 'Per-flight options')
     group.add_option('-i', '--igc', metavar='FILENAME', type='string',
             action='callback', callback=add_flight,
-            help='set flight IGC file')
+            help='set flight IGC or GPX file, optionally compressed with gzip '
+                 'or bzip2, or a zip archive of them')
     group.add_option('-n', '--pilot-name', metavar='STRING', type='string',
             action='callback', callback=set_flight_option,
             help='set pilot name')
@@ -127,6 +192,8 @@ def main(argv):
     parser.set_defaults(flights=[])
     parser.set_defaults(roots=[])
     parser.set_defaults(tz_offset=0)
+    parser.set_defaults(windows=())
+    parser.set_defaults(cache=None)
     #
     options, args = parser.parse_args(argv)
     if len(options.flights) == 0:
@@ -139,7 +206,8 @@ def main(argv):
     kmz = flights2kmz(options.flights,
                       roots=roots,
                       tz_offset=options.tz_offset,
-                      task=task)
+                      task=task,
+                      lod=options.lod)
     output = options.output or default_output
     kmz.write(output, '2.2')
 
@@ -15,8 +15,7 @@
 #   along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 
-import datetime
-from math import pi, sqrt
+from math import cos, degrees, pi, sqrt
 from itertools import cycle, izip
 import operator
 import os
@@ -27,10 +26,12 @@ import urlparse
 import third_party.pygooglechart as pygooglechart
 
 from color import bilinear_gradient, default_gradient
-from coord import rad_to_cardinal
+from coord import dt_to_t, rad_to_cardinal
+from geodesy import R
 import kml
 import kmz
 from scale import Scale, TimeScale, ZeroCenteredScale
+from track import LOD_TOLERANCES
 import util
 
 
@@ -224,11 +225,12 @@ class Flight(object):
         if self.glider_id:
             rows.append(('Glider ID', self.glider_id))
         take_off_time = self.track.bounds.time.min + globals.tz_offset
-        rows.append(('Take-off time', take_off_time.strftime('%H:%M:%S')))
+        rows.append(('Take-off time',
+                     util.strftime('%H:%M:%S', take_off_time)))
         landing_time = self.track.bounds.time.max + globals.tz_offset
-        rows.append(('Landing time', landing_time.strftime('%H:%M:%S')))
-        duration = (self.track.bounds.time.max 
-                    - self.track.bounds.time.min).seconds
+        rows.append(('Landing time', util.strftime('%H:%M:%S', landing_time)))
+        duration = int(self.track.bounds.time.max
+                       - self.track.bounds.time.min)
         hour, seconds = divmod(duration, 3600)
         minute, second = divmod(seconds, 60)
         rows.append(('Duration', '%dh %02dm %02ds' % (hour, minute, second)))
@@ -262,20 +264,66 @@ class Flight(object):
         else:
             xc = None
         date = self.track.bounds.time.min + globals.tz_offset
-        strings = [self.pilot_name, xc, date.strftime('%Y-%m-%d')]
+        strings = [self.pilot_name, xc, util.strftime('%Y-%m-%d', date)]
         snippet = kml.Snippet(', '.join(s for s in strings if s))
         return kmz.kmz(snippet)
 
+    def make_regions(self, globals, level=0):
+        """Return the levels of detail to draw the track at, each with the
+        Region that shows it.
+
+        If globals.lod is set then every level is drawn, and each is shown
+        while the track is drawn at between about one and four of its
+        tolerances per pixel, otherwise only level is drawn, with no Region.
+
+        """
+        if not globals.lod:
+            return [(level, None)]
+        lat, lon = self.track.trig.lat, self.track.trig.lon
+        middle_lat = (max(lat) + min(lat)) / 2.0
+        middle_lon = (max(lon) + min(lon)) / 2.0
+        # Google Earth measures a Region by the square root of its area on
+        # the screen, so the box is a square as wide as the longer side of
+        # the track's bounds, which keeps thin tracks switching levels
+        size = R * max(max(lat) - min(lat),
+                       (max(lon) - min(lon)) * cos(middle_lat))
+        dlat = size / (2.0 * R)
+        dlon = dlat / cos(middle_lat)
+        north, south = middle_lat + dlat, middle_lat - dlat
+        east, west = middle_lon + dlon, middle_lon - dlon
+        tolerances = (0.0,) + LOD_TOLERANCES + (None,)
+        result = []
+        for level in xrange(0, len(LOD_TOLERANCES) + 1):
+            min_pixels = size / tolerances[level + 1] \
+                         if tolerances[level + 1] else 0
+            max_pixels = size / tolerances[level] if tolerances[level] else -1
+            lod = kml.Lod(kml.minLodPixels(int(min_pixels)),
+                          kml.maxLodPixels(int(max_pixels)))
+            box = kml.LatLonAltBox(kml.north(degrees(north)),
+                                   kml.south(degrees(south)),
+                                   kml.east(degrees(east)),
+                                   kml.west(degrees(west)))
+            result.append((level, kml.Region(box, lod)))
+        return result
+
+    def level_coords(self, level):
+        """Return the coordinates of the track at level of detail."""
+        if level == 0:
+            return self.track.coords
+        return [self.track.coords[i] for i in self.track.lod[level]]
+
     def make_solid_track(self, globals, style, altitude_mode, extrude=None,
-                         **folder_options):
-        line_string = kml.LineString(coordinates=self.track.coords,
-                                     altitudeMode=altitude_mode)
-        if extrude:
-            line_string.add(extrude=1)
-        placemark = kml.Placemark(style, line_string)
+                         level=0, **folder_options):
+        placemarks = []
+        for level, region in self.make_regions(globals, level):
+            line_string = kml.LineString(coordinates=self.level_coords(level),
+                                         altitudeMode=altitude_mode)
+            if extrude:
+                line_string.add(extrude=1)
+            placemarks.append(kml.Placemark(style, region, line_string))
         style_url = globals.stock.check_hide_children_style.url()
         folder_options['styleUrl'] = style_url
-        return kmz.kmz(kml.Folder(placemark, **folder_options))
+        return kmz.kmz(kml.Folder(*placemarks, **folder_options))
 
     def make_scale_chart(self, globals, scale):
         chart = pygooglechart.SimpleLineChart(40, 200, x_range=(0, 1),
@@ -297,20 +345,41 @@ class Flight(object):
         return chart
 
     def make_colored_track(self, globals, values, scale, altitude_mode,
-                           scale_chart=True, **folder_options):
+                           scale_chart=True, name=None, level=0,
+                           **folder_options):
         style_url = globals.stock.check_hide_children_style.url()
-        folder = kml.Folder(name='Colored by %s' % scale.title,
+        folder = kml.Folder(name=name or 'Colored by %s' % scale.title,
                             styleUrl=style_url, **folder_options)
         styles = [kml.Style(kml.LineStyle(color=color, width=self.width))
                   for color in scale.colors()]
-        discrete_values = map(scale.discretize, values)
-        for sl in util.runs(discrete_values):
-            coordinates = self.track.coords[sl.start:sl.stop + 1]
-            line_string = kml.LineString(coordinates=coordinates,
-                                         altitudeMode=self.altitude_mode)
-            style_url = kml.styleUrl(styles[discrete_values[sl.start]].url())
-            placemark = kml.Placemark(style_url, line_string)
-            folder.add(placemark)
+        regions = self.make_regions(globals, level)
+        if any(level for level, region in regions):
+            sums = [0.0]
+            for value in values:
+                sums.append(sums[-1] + value)
+        for level, region in regions:
+            coords = self.level_coords(level)
+            if level == 0:
+                discrete_values = map(scale.discretize, values)
+            else:
+                # Each coarse segment takes the mean of the values of the
+                # segments that it replaces
+                indexes = self.track.lod[level]
+                discrete_values = [scale.discretize((sums[j] - sums[i])
+                                                    / (j - i))
+                                   for i, j in izip(indexes, indexes[1:])]
+            if region is None:
+                level_folder = folder
+            else:
+                level_folder = kml.Folder(region)
+                folder.add(level_folder)
+            for start, stop in zip(*util.run_edges(discrete_values)):
+                coordinates = coords[start:stop + 1]
+                line_string = kml.LineString(coordinates=coordinates,
+                                             altitudeMode=self.altitude_mode)
+                style_url = kml.styleUrl(styles[discrete_values[start]].url())
+                placemark = kml.Placemark(style_url, line_string)
+                level_folder.add(placemark)
         if scale_chart:
             href = self.make_scale_chart(globals, scale).get_url()
             icon = kml.Icon(href=kml.CDATA(href))
@@ -348,6 +417,18 @@ class Flight(object):
                                            globals.scales.speed,
                                            self.altitude_mode,
                                            visibility=visibility))
+        for window, series in sorted(self.track.series.items()):
+            if self.track.elevation_data:
+                name = 'Colored by climb over %ds' % window
+                folder.add(self.make_colored_track(globals, series.climb,
+                                                   globals.scales.climb,
+                                                   'absolute', name=name,
+                                                   visibility=0))
+            name = 'Colored by ground speed over %ds' % window
+            folder.add(self.make_colored_track(globals, series.speed,
+                                               globals.scales.speed,
+                                               self.altitude_mode, name=name,
+                                               visibility=0))
         if hasattr(self.track, 'tas'):
             visibility = globals.default_track == 'tas'
             folder.add(self.make_colored_track(globals, self.track.tas,
@@ -366,7 +447,7 @@ class Flight(object):
                                          visibility=visibility))
         return folder
 
-    def make_shadow_folder(self, globals):
+    def make_shadow_folder(self, globals, level=0):
         if not self.track.elevation_data:
             return kmz.kmz()
         style_url = globals.stock.radio_folder_style.url()
@@ -374,15 +455,17 @@ class Flight(object):
         folder.add(globals.stock.invisible_none_folder)
         style = kml.Style(kml.LineStyle(color='ff000000', width=1))
         folder.add(self.make_solid_track(globals, style, 'clampToGround',
-                                         name='Normal'))
+                                         level=level, name='Normal'))
         line_style = kml.LineStyle(color='00000000', width=1)
         poly_style = kml.PolyStyle(color='80000000')
         style = kml.Style(line_style, poly_style)
         folder.add(self.make_solid_track(globals, style, 'absolute', True,
-                                         name='Extrude', visibility=0))
+                                         level=level, name='Extrude',
+                                         visibility=0))
         style = kml.Style(kml.LineStyle(color=self.color, width=self.width))
         folder.add(self.make_solid_track(globals, style, 'clampToGround',
-                                         name='Solid color', visibility=0))
+                                         level=level, name='Solid color',
+                                         visibility=0))
         return folder
 
     def make_animation(self, globals):
@@ -392,23 +475,24 @@ class Flight(object):
         list_style = kml.ListStyle(listItemType='checkHideChildren')
         style = kml.Style(icon_style, list_style)
         folder = kml.Folder(style, name='Animation', visibility=0)
-        point = kml.Point(coordinates=[self.track.coords[0]],
+        coords = list(self.track.coords)
+        point = kml.Point(coordinates=[coords[0]],
                           altitudeMode=self.altitude_mode)
-        timespan = kml.TimeSpan(end=kml.dateTime(self.track.coords[0].dt))
+        timespan = kml.TimeSpan(end=kml.dateTime(coords[0].t))
         placemark = kml.Placemark(point, timespan, styleUrl=style.url())
         folder.add(placemark)
-        for i in xrange(1, len(self.track.coords)):
-            coord = self.track.coords[i - 1].halfway_to(self.track.coords[i])
+        for i in xrange(1, len(coords)):
+            coord = coords[i - 1].halfway_to(coords[i])
             point = kml.Point(coordinates=[coord],
                               altitudeMode=self.altitude_mode)
-            begin = kml.dateTime(self.track.coords[i - 1].dt)
-            end = kml.dateTime(self.track.coords[i].dt)
+            begin = kml.dateTime(coords[i - 1].t)
+            end = kml.dateTime(coords[i].t)
             timespan = kml.TimeSpan(begin=begin, end=end)
             placemark = kml.Placemark(point, timespan, styleUrl=style.url())
             folder.add(placemark)
-        point = kml.Point(coordinates=[self.track.coords[-1]],
+        point = kml.Point(coordinates=[coords[-1]],
                           altitudeMode=self.altitude_mode)
-        timespan = kml.TimeSpan(begin=kml.dateTime(self.track.coords[-1].dt))
+        timespan = kml.TimeSpan(begin=kml.dateTime(coords[-1].t))
         placemark = kml.Placemark(point, timespan, styleUrl=style.url())
         folder.add(placemark)
         return kmz.kmz(folder)
@@ -416,12 +500,12 @@ class Flight(object):
     def make_tour_folder(self, globals):
         style_url = globals.stock.check_hide_children_style.url()
         folder = kmz.kmz(kml.Folder(name='Tour', styleUrl=style_url))
-        dt = self.track.coords[0].dt
-        delta = datetime.timedelta(seconds=15 * 60)
-        coords = []
-        while dt < self.track.coords[-1].dt:
-            coords.append(self.track.coord_at(dt))
-            dt += delta
+        times = []
+        t = self.track.coords[0].t
+        while t < self.track.coords[-1].t:
+            times.append(t)
+            t += 15 * 60
+        coords = self.track.coords_at(times)
         for i in xrange(0, len(coords)):
             j = (i + 1) % len(coords)
             point = kml.Point(coordinates=[coords[i]], altitudeMode=self.altitude_mode)
@@ -459,7 +543,12 @@ class Flight(object):
         if not len(self.photos):
             return kmz.kmz()
         folder = kml.Folder(name='Photos', open=0)
-        for photo in sorted(self.photos, key=operator.attrgetter('dt')):
+        photos = sorted(self.photos, key=operator.attrgetter('dt'))
+        coords = iter(self.track.coords_at(dt_to_t(photo.dt)
+                                           - globals.tz_offset
+                                           for photo in photos
+                                           if not photo.coord))
+        for photo in photos:
             if photo.coord:
                 coord = photo.coord
                 if photo.elevation_data:
@@ -467,7 +556,7 @@ class Flight(object):
                 else:
                     altitude_mode = 'clampToGround'
             else:
-                coord = self.track.coord_at(photo.dt - globals.tz_offset)
+                coord = next(coords)
                 altitude_mode = self.altitude_mode
             point = kml.Point(coordinates=[coord], altitudeMode=altitude_mode)
             if photo.description:
@@ -546,7 +635,7 @@ class Flight(object):
                                                 route.multiplier)))
             rows.append(('Score', '<b>%.2f points</b>' % route.score))
             speed = 3600.0 * route.distance \
-                    / (route.tps[-1].coord.dt - route.tps[0].coord.dt).seconds
+                    / (route.tps[-1].coord.t - route.tps[0].coord.t)
             rows.append(('Average speed', '%.1fkm/h' % speed))
             if route.circuit:
                 rows.append(make_row(route, -1, 0))
@@ -558,8 +647,8 @@ class Flight(object):
             route_folder = kml.Folder(name=name, description=kml.CDATA(table),
                                       Snippet=None, styleUrl=style_url,
                                       visibility=visibility)
-            for tp in route.tps:
-                coord = self.track.coord_at(tp.coord.dt)
+            coords = self.track.coords_at(tp.coord.t for tp in route.tps)
+            for tp, coord in izip(route.tps, coords):
                 point = kml.Point(coordinates=[coord],
                                   altitudeMode=self.altitude_mode, extrude=1)
                 style_url = globals.stock.xc_style.url()
@@ -594,17 +683,10 @@ class Flight(object):
             coord1 = self.track.coords[sl.stop]
             coord = coord0.halfway_to(coord1)
             point = kml.Point(coordinates=[coord], altitudeMode='absolute')
-            total_dz_positive = total_dz_negative = 0
+            summary = self.track.summarise(sl)
             peak_climb = util.Bounds(0.0)
-            for i in xrange(sl.start, sl.stop):
-                dz = self.track.coords[i + 1].ele - self.track.coords[i].ele
-                dt = self.track.t[i + 1] - self.track.t[i]
-                if dz > 0:
-                    total_dz_positive += dz
-                elif dz < 0:
-                    total_dz_negative += dz
-                peak_climb.update(float(dz) / dt)
-            climb = util.Bounds(self.track.climb[sl])
+            peak_climb.update(summary.vs)
+            climb = summary.climb
             dz = float(self.track.coords[sl.stop].ele
                        - self.track.coords[sl.start].ele)
             dt = self.track.t[sl.stop] - self.track.t[sl.start]
@@ -628,14 +710,14 @@ class Flight(object):
             dict['peak_descent'] = round(peak_climb.min, 1)
             dict['start_altitude'] = coord0.ele
             dict['finish_altitude'] = coord1.ele
-            start_time = coord0.dt + globals.tz_offset
-            dict['start_time'] = start_time.strftime('%H:%M:%S')
-            stop_time = coord1.dt + globals.tz_offset
-            dict['finish_time'] = stop_time.strftime('%H:%M:%S')
+            start_time = coord0.t + globals.tz_offset
+            dict['start_time'] = util.strftime('%H:%M:%S', start_time)
+            stop_time = coord1.t + globals.tz_offset
+            dict['finish_time'] = util.strftime('%H:%M:%S', stop_time)
             duration = self.track.t[sl.stop] - self.track.t[sl.start]
             dict['duration'] = '%dm %02ds' % divmod(duration, 60)
-            dict['accumulated_altitude_gain'] = total_dz_positive
-            dict['accumulated_altitude_loss'] = total_dz_negative
+            dict['accumulated_altitude_gain'] = summary.dz_positive
+            dict['accumulated_altitude_loss'] = summary.dz_negative
             dict['drift_direction'] = rad_to_cardinal(theta + pi)
             extended_data = kml.ExtendedData.dict(dict)
             if title == 'thermal':
@@ -669,15 +751,26 @@ class Flight(object):
                                           scale.range[0], scale.range[1])
         chart.set_axis_style(axis_index, 'ffffff')
         chart.set_grid(globals.scales.time.grid_step, scale.grid_step, 2, 2)
+        if len(values) == len(self.track.t):
+            x, t = self.time_positions, self.track.t
+        else:
+            # Values between consecutive coordinates are drawn at the
+            # midpoints between them
+            x = [(x0 + x1) / 2.0 for x0, x1 in izip(self.time_positions,
+                                                    self.time_positions[1:])]
+            t = [(t0 + t1) / 2.0 for t0, t1 in izip(self.track.t,
+                                                    self.track.t[1:])]
+        values = [min(max(v, scale.range[0]), scale.range[1])
+                  for v in values]
         y = [globals.graph_height * (v - scale.range[0])
              / (scale.range[1] - scale.range[0])
              for v in values]
-        indexes = util.incr_douglas_peucker(self.time_positions, y, 1, 450)
-        chart.add_data([self.track.t[i] for i in indexes])
+        indexes = util.incr_douglas_peucker(x, y, 1, 450)
+        chart.add_data([t[i] for i in indexes])
         chart.add_data([values[i] for i in indexes])
         return chart
 
-    def make_graph(self, globals, values, scale):
+    def make_graph(self, globals, values, scale, name=None):
         href = self.make_graph_chart(globals, values, scale).get_url()
         icon = kml.Icon(href=kml.CDATA(href))
         overlay_xy = kml.overlayXY(x=0, xunits='fraction',
@@ -685,42 +778,45 @@ class Flight(object):
         screen_xy = kml.screenXY(x=0, xunits='fraction', y=16, yunits='pixels')
         size = kml.size(x=0, xunits='fraction', y=0, yunits='fraction')
         screen_overlay = kml.ScreenOverlay(icon, overlay_xy, screen_xy, size)
-        name = scale.title.capitalize() + " graph"
+        name = name or scale.title.capitalize() + " graph"
         style_url = globals.stock.check_hide_children_style.url()
         folder = kml.Folder(screen_overlay, name=name, styleUrl=style_url,
                             visibility=0)
         return folder
 
-    def make_time_mark(self, globals, coord, dt, style_url):
+    def make_time_mark(self, globals, coord, t, style_url):
         point = kml.Point(coordinates=[coord], altitudeMode=self.altitude_mode)
-        name = (dt + globals.tz_offset).strftime('%H:%M')
+        name = util.strftime('%H:%M', t + globals.tz_offset)
         return kml.Placemark(point, name=name, styleUrl=style_url)
 
-    def make_time_marks_folder(self, globals, step=datetime.timedelta(0, 300)):
+    def make_time_marks_folder(self, globals, step=300):
         style_url = globals.stock.check_hide_children_style.url()
         folder = kml.Folder(name='Time marks', styleUrl=style_url, visibility=0)
         coord = self.track.coords[0]
         style_url = globals.stock.time_mark_styles[0].url()
-        folder.add(self.make_time_mark(globals, coord, coord.dt, style_url))
-        dt = util.datetime_floor(self.track.coords[0].dt, step)
-        while dt <= self.track.coords[0].dt:
-            dt += step
-        while dt < self.track.coords[-1].dt:
-            coord = self.track.coord_at(dt)
-            if dt.minute == 0:
+        folder.add(self.make_time_mark(globals, coord, coord.t, style_url))
+        times = []
+        t = util.time_floor(self.track.coords[0].t, step)
+        while t <= self.track.coords[0].t:
+            t += step
+        while t < self.track.coords[-1].t:
+            times.append(t)
+            t += step
+        for t, coord in izip(times, self.track.coords_at(times)):
+            minute = t / 60 % 60
+            if minute == 0:
                 style_index = 0
-            elif dt.minute == 30:
+            elif minute == 30:
                 style_index = 1
-            elif dt.minute == 15 or dt.minute == 45:
+            elif minute == 15 or minute == 45:
                 style_index = 2
             else:
                 style_index = 3
             style_url = globals.stock.time_mark_styles[style_index].url()
-            folder.add(self.make_time_mark(globals, coord, dt, style_url))
-            dt += step
+            folder.add(self.make_time_mark(globals, coord, t, style_url))
         coord = self.track.coords[-1]
         style_url = globals.stock.time_mark_styles[0].url()
-        folder.add(self.make_time_mark(globals, coord, coord.dt, style_url))
+        folder.add(self.make_time_mark(globals, coord, coord.t, style_url))
         return folder
 
     def to_kmz(self, globals):
@@ -743,6 +839,14 @@ class Flight(object):
         if self.track.elevation_data:
             eles = [c.ele for c in self.track.coords]
             folder.add(self.make_graph(globals, eles, globals.scales.altitude))
+        for window, series in sorted(self.track.series.items()):
+            if self.track.elevation_data:
+                name = 'Climb graph over %ds' % window
+                folder.add(self.make_graph(globals, series.climb,
+                                           globals.scales.climb, name=name))
+            name = 'Ground speed graph over %ds' % window
+            folder.add(self.make_graph(globals, series.speed,
+                                       globals.scales.speed, name=name))
         folder.add(self.make_analysis_folder(globals, 'thermal',
                                              self.track.thermals,
                                              globals.stock.thermal_style.url()))
@@ -824,19 +928,23 @@ def make_task_folder(globals, task):
     return kmz.kmz(folder)
 
 
-def flights2kmz(flights, roots=[], tz_offset=0, task=None):
+def flights2kmz(flights, roots=[], tz_offset=0, task=None, lod=False):
     stock = Stock()
     globals = util.OpenStruct()
     globals.stock = stock
     globals.bounds = util.BoundsSet()
     for flight in flights:
+        # The bounds of the windowed series are only known once they are
+        # computed
+        flight.track.evaluate()
         globals.bounds.update(flight.track.bounds)
     if globals.bounds.climb.min < -5.0:
         globals.bounds.climb.min = -5.0
     if globals.bounds.climb.max > 5.0:
         globals.bounds.climb.max = 5.0
-    globals.tz_offset = datetime.timedelta(0, 3600 * tz_offset)
+    globals.tz_offset = 3600 * tz_offset
     globals.task = task
+    globals.lod = lod
     globals.scales = util.OpenStruct()
     globals.scales.altitude = Scale(globals.bounds.ele.tuple(),
                                     title='altitude', gradient=default_gradient)
@@ -0,0 +1,196 @@
+#   igc2kmz track cache functions
+#   Copyright (C) 2008  Tom Payne
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+from array import array
+import cPickle as pickle
+try:
+    from hashlib import sha1
+except ImportError:
+    from sha import new as sha1
+import os
+import tempfile
+import zlib
+
+from coord import Coord, CoordArray
+from geodesy import Trig
+from track import INDEXED, SIMPLIFIED, Track
+
+
+MAGIC = 'igc2kmz track cache\n'
+VERSION = 8
+
+
+def encode_list(value):
+    """Encode a list as raw array bytes where possible."""
+    if value and all(type(c) is Coord for c in value):
+        ele_typecode = 'l' if all(type(c.ele) is int for c in value) else 'd'
+        return ('coords',
+                array('d', (c.lat for c in value)).tostring(),
+                array('d', (c.lon for c in value)).tostring(),
+                ele_typecode,
+                array(ele_typecode, (c.ele for c in value)).tostring(),
+                array('d', (c.t for c in value)).tostring())
+    if value and all(type(x) is int for x in value):
+        return ('array', 'l', array('l', value).tostring())
+    if value and all(type(x) is float for x in value):
+        return ('array', 'd', array('d', value).tostring())
+    return ('object', value)
+
+
+def encode_coord_array(value):
+    """Encode a CoordArray as raw array bytes."""
+    return ('coord_array', value.ele.typecode,
+            value.column('lat').tostring(), value.column('lon').tostring(),
+            value.column('ele').tostring(), value.column('t').tostring())
+
+
+def decode_coord_array(value):
+    """Decode a CoordArray encoded by encode_coord_array."""
+    ele_typecode, lat, lon, ele, t = value[1:]
+    return CoordArray.from_columns(array('d', lat), array('d', lon),
+                                   array(ele_typecode, ele), array('d', t))
+
+
+def decode_list(value):
+    """Decode a list encoded by encode_list."""
+    if value[0] == 'coords':
+        lat, lon, ele_typecode, ele, t = value[1:]
+        lat = array('d', lat)
+        lon = array('d', lon)
+        ele = array(ele_typecode, ele)
+        t = array('d', t)
+        return [Coord(lat[i], lon[i], ele[i], t=t[i])
+                for i in xrange(0, len(t))]
+    if value[0] == 'array':
+        return array(value[1], value[2]).tolist()
+    return value[1]
+
+
+def dumps(track):
+    """Return track in the cache's binary format, with all of its analysis.
+
+    The state is compressed, and the trigonometry in trig is left out to be
+    recomputed from the coordinates by loads.
+
+    """
+    track.evaluate()
+    state = {}
+    for key, value in track.__dict__.items():
+        if key in INDEXED + SIMPLIFIED or isinstance(value, Trig):
+            continue
+        if isinstance(value, list):
+            state[key] = encode_list(value)
+        elif isinstance(value, CoordArray):
+            state[key] = encode_coord_array(value)
+        else:
+            state[key] = ('object', value)
+    return MAGIC + chr(VERSION) + zlib.compress(pickle.dumps(state, 2), 1)
+
+
+def loads(data):
+    """Return the track stored by dumps in data."""
+    if not data.startswith(MAGIC) or data[len(MAGIC)] != chr(VERSION):
+        raise ValueError('not a version %d track cache entry' % VERSION)
+    state = pickle.loads(zlib.decompress(data[len(MAGIC) + 1:]))
+    track = Track.__new__(Track)
+    for key, value in state.items():
+        if value[0] == 'object':
+            track.__dict__[key] = value[1]
+        elif value[0] == 'coord_array':
+            track.__dict__[key] = decode_coord_array(value)
+        else:
+            track.__dict__[key] = decode_list(value)
+    track.trig = Trig(track.coords)
+    return track
+
+
+class Cache(object):
+    """A size-bounded, least recently used, on-disk cache of tracks.
+
+    Entries are keyed by the SHA-1 of the input file's contents and the
+    analysis parameters, so they never need invalidating.  Reading an entry
+    touches its modification time, and the oldest entries are removed when
+    the total size exceeds max_size bytes.
+
+    """
+
+    def __init__(self, directory, max_size=64 * 1024 * 1024):
+        self.directory = directory
+        self.max_size = max_size
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+
+    def key(self, data, *params):
+        """Return the key for the file contents data and params."""
+        hash = sha1(data)
+        hash.update(repr((VERSION, params)))
+        return hash.hexdigest()
+
+    def filename(self, key):
+        return os.path.join(self.directory, key + '.track')
+
+    def get(self, key, name=None):
+        """Return the track with key, or None if it is not cached or its
+        entry cannot be read.
+
+        Entries are keyed by contents alone, so the track is renamed to name
+        if it is given.
+
+        """
+        filename = self.filename(key)
+        try:
+            data = open(filename, 'rb').read()
+            track = loads(data)
+            os.utime(filename, None)
+        except Exception:
+            return None
+        if name is not None:
+            track.filename = name
+        return track
+
+    def put(self, key, track):
+        """Store track with key and evict old entries."""
+        fd, filename = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        file = os.fdopen(fd, 'wb')
+        try:
+            file.write(dumps(track))
+        finally:
+            file.close()
+        os.rename(filename, self.filename(key))
+        self.evict()
+
+    def evict(self):
+        """Remove the least recently used entries until under max_size."""
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith('.track'):
+                continue
+            try:
+                st = os.stat(os.path.join(self.directory, name))
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, name))
+        entries.sort()
+        size = sum(entry[1] for entry in entries)
+        for mtime, entry_size, name in entries:
+            if size <= self.max_size:
+                break
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                pass
+            size -= entry_size
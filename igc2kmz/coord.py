@@ -15,10 +15,17 @@
 #   along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 
-from math import acos, asin, atan2, cos, pi, sin, sqrt
+from array import array
+import calendar
+import datetime
+from itertools import izip, repeat
+from math import asin, atan2, cos, pi, sin, sqrt
 
+import geodesy
+from geodesy import R
 
-R = 6371000.0
+
+NAN = float('nan')
 cardinals = 'N NNE NE ENE E ESE SE SSE S SSW SW WSW W WNW NW NNW'.split()
 
 
@@ -40,6 +47,18 @@ class degreeattr(object):
         setattr(obj, self.attr, pi * value / 180.0)
 
 
+class datetimeattr(object):
+
+    def __init__(self, attr):
+        self.attr = attr
+
+    def __get__(self, obj, type=None):
+        return t_to_dt(getattr(obj, self.attr))
+
+    def __set__(self, obj, value):
+        setattr(obj, self.attr, dt_to_t(value))
+
+
 class degreemethod(object):
 
     def __new__(cls, f):
@@ -49,24 +68,27 @@ class degreemethod(object):
 
 
 class Coord(object):
+    """A point.  t is in seconds since the UTC epoch, or NAN if the time is
+    unknown, and dt is the same time as a datetime, or None."""
 
-    __slots__ = ('lat', 'lon', 'ele', 'dt')
+    __slots__ = ('lat', 'lon', 'ele', 't')
 
     lat_deg = degreeattr('lat')
     lon_deg = degreeattr('lon')
+    dt = datetimeattr('t')
 
-    def __init__(self, lat, lon, ele, dt=None):
+    def __init__(self, lat, lon, ele, dt=None, t=NAN):
         self.lat = lat
         self.lon = lon
         self.ele = ele
-        self.dt = dt
+        self.t = t if dt is None else dt_to_t(dt)
 
     @classmethod
-    def deg(cls, lat, lon, ele, dt=None):
-        return cls(pi * lat / 180.0, pi * lon / 180.0, ele, dt)
+    def deg(cls, lat, lon, ele, dt=None, t=NAN):
+        return cls(pi * lat / 180.0, pi * lon / 180.0, ele, dt, t)
 
     def dup(self):
-        return Coord(self.lat, self.lon, self.ele, self.dt)
+        return Coord(self.lat, self.lon, self.ele, t=self.t)
 
     def initial_bearing_to(self, other):
         """Return the initial bearing from self to other."""
@@ -77,11 +99,28 @@ class Coord(object):
 
     initial_bearing_to_deg = degreemethod(initial_bearing_to)
 
-    def distance_to(self, other):
-        """Return the distance from self to other."""
-        d = sin(self.lat) * sin(other.lat) \
-            + cos(self.lat) * cos(other.lat) * cos(self.lon - other.lon)
-        return R * acos(d) if d < 1.0 else 0.0
+    def distance_to(self, other, threshold=None):
+        """Return the distance from self to other.
+
+        If threshold is given and self and other differ by less than
+        threshold / R radians in both latitude and longitude then the
+        distance is approximated on a local projection, to within
+        geodesy.max_distance_error.  In latitude this is threshold metres,
+        but in longitude it is threshold metres only at the equator, and
+        less by a factor of cos(lat) elsewhere.
+
+        """
+        if threshold is not None:
+            dlat = other.lat - self.lat
+            dlon = other.lon - self.lon
+            limit = threshold / R
+            if -limit <= dlat <= limit and -limit <= dlon <= limit:
+                return R * sqrt(dlat * dlat + cos(self.lat) * cos(other.lat)
+                                * dlon * dlon)
+        s_lat = sin((other.lat - self.lat) / 2.0)
+        s_lon = sin((other.lon - self.lon) / 2.0)
+        a = s_lat * s_lat + cos(self.lat) * cos(other.lat) * s_lon * s_lon
+        return R * (2.0 * asin(sqrt(min(a, 1.0))))
 
     def halfway_to(self, other):
         """Return the point halfway between self and other."""
@@ -96,9 +135,10 @@ class Coord(object):
 
     def interpolate(self, other, delta):
         """Return the point delta between self and other."""
-        d = sin(self.lat) * sin(other.lat) \
-            + cos(self.lat) * cos(other.lat) * cos(other.lon - self.lon)
-        d = delta * acos(d) if d < 1.0 else 0.0
+        s_lat = sin((other.lat - self.lat) / 2.0)
+        s_lon = sin((other.lon - self.lon) / 2.0)
+        a = s_lat * s_lat + cos(self.lat) * cos(other.lat) * s_lon * s_lon
+        d = delta * (2.0 * asin(sqrt(min(a, 1.0))))
         y = sin(other.lon - self.lon) * cos(other.lat)
         x = cos(self.lat) * sin(other.lat) \
             - sin(self.lat) * cos(other.lat) * cos(other.lon - self.lon)
@@ -117,3 +157,230 @@ class Coord(object):
                                cos(d / R) - sin(self.lat) * sin(lat))
         ele = self.ele
         return Coord(lat, lon, ele)
+
+
+def dt_to_t(dt):
+    """Return the datetime dt in seconds since the UTC epoch, or NAN if it
+    is None."""
+    if dt is None:
+        return NAN
+    return calendar.timegm(dt.timetuple()) + dt.microsecond / 1000000.0
+
+
+def t_to_dt(t):
+    """Return seconds since the UTC epoch as a datetime, or None if it is
+    NAN."""
+    if t != t:
+        return None
+    return datetime.datetime.utcfromtimestamp(t)
+
+
+def double_array(values):
+    """Return the array or NumPy array values as an array of doubles."""
+    if isinstance(values, array) and values.typecode == 'd':
+        return values
+    result = array('d')
+    result.fromstring(values.astype(float).tostring())
+    return result
+
+
+def broadcast(value, n):
+    """Return value as a sequence of length n, repeating it if it is a
+    scalar."""
+    if isinstance(value, (int, long, float)):
+        return repeat(value, n)
+    if len(value) != n:
+        raise ValueError('length %d does not match %d' % (len(value), n))
+    return value
+
+
+class CoordArray(object):
+    """A sequence of coordinates stored as columns.
+
+    lat and lon are in radians, ele is in metres and t is in seconds since
+    the UTC epoch, with NAN marking unknown times.  Slices with a step of one
+    are views that share their parent's columns.  Coords are only created
+    when indexed or iterated.  The batch methods take either a Coord or a
+    CoordArray of the same length as other.
+
+    """
+
+    def __init__(self, ele_typecode='d'):
+        self.lat = array('d')
+        self.lon = array('d')
+        self.ele = array(ele_typecode)
+        self.t = array('d')
+        self.start = 0
+        self.stop = None
+
+    @classmethod
+    def from_coords(cls, coords):
+        if all(type(c.ele) is int for c in coords):
+            result = cls('l')
+        else:
+            result = cls('d')
+        result.extend(coords)
+        return result
+
+    @classmethod
+    def from_columns(cls, lat, lon, ele, t):
+        result = cls.__new__(cls)
+        result.lat, result.lon, result.ele, result.t = lat, lon, ele, t
+        result.start, result.stop = 0, None
+        if not len(lat) == len(lon) == len(ele) == len(t):
+            raise ValueError('columns have different lengths')
+        return result
+
+    def __len__(self):
+        if self.stop is None:
+            return len(self.t) - self.start
+        return self.stop - self.start
+
+    def __iter__(self):
+        for i in xrange(self.start, self.start + len(self)):
+            yield Coord(self.lat[i], self.lon[i], self.ele[i], t=self.t[i])
+
+    def __getitem__(self, index):
+        n = len(self)
+        if isinstance(index, slice):
+            start, stop, step = index.indices(n)
+            if step != 1:
+                return self.take(xrange(start, stop, step))
+            result = CoordArray.from_columns(self.lat, self.lon, self.ele,
+                                             self.t)
+            result.start = self.start + start
+            result.stop = self.start + max(start, stop)
+            return result
+        if index < 0:
+            index += n
+        if not 0 <= index < n:
+            raise IndexError('CoordArray index out of range')
+        i = self.start + index
+        return Coord(self.lat[i], self.lon[i], self.ele[i], t=self.t[i])
+
+    def column(self, name):
+        """Return a copy of the column name of this array."""
+        if self.stop is None:
+            return getattr(self, name)[self.start:]
+        return getattr(self, name)[self.start:self.stop]
+
+    def take(self, indexes):
+        """Return a new array of the coordinates at indexes."""
+        result = CoordArray(self.ele.typecode)
+        for i in indexes:
+            i += self.start
+            result.lat.append(self.lat[i])
+            result.lon.append(self.lon[i])
+            result.ele.append(self.ele[i])
+            result.t.append(self.t[i])
+        return result
+
+    def append(self, coord):
+        if self.stop is not None:
+            raise ValueError('cannot append to a slice of a CoordArray')
+        self.lat.append(coord.lat)
+        self.lon.append(coord.lon)
+        self.ele.append(coord.ele)
+        self.t.append(coord.t)
+
+    def extend(self, coords):
+        if self.stop is not None:
+            raise ValueError('cannot extend a slice of a CoordArray')
+        if isinstance(coords, CoordArray):
+            self.lat.extend(coords.column('lat'))
+            self.lon.extend(coords.column('lon'))
+            self.ele.extend(coords.column('ele'))
+            self.t.extend(coords.column('t'))
+        else:
+            for coord in coords:
+                self.append(coord)
+
+    def other_columns(self, other):
+        """Return the lat, lon and ele of other for each coordinate."""
+        n = len(self)
+        if isinstance(other, CoordArray):
+            if len(other) != n:
+                raise ValueError('length %d does not match %d'
+                                 % (len(other), n))
+            return (other.column('lat'), other.column('lon'),
+                    other.column('ele'))
+        return (repeat(other.lat, n), repeat(other.lon, n),
+                repeat(other.ele, n))
+
+    def trig_columns(self, other=None):
+        """Return the lat, lon, sin_lat and cos_lat of self, or of other for
+        each coordinate of self."""
+        if other is None:
+            lat, lon = self.column('lat'), self.column('lon')
+        elif isinstance(other, CoordArray):
+            if len(other) != len(self):
+                raise ValueError('length %d does not match %d'
+                                 % (len(other), len(self)))
+            lat, lon = other.column('lat'), other.column('lon')
+        else:
+            return (other.lat, other.lon, sin(other.lat), cos(other.lat))
+        return (lat, lon, array('d', (sin(x) for x in lat)),
+                array('d', (cos(x) for x in lat)))
+
+    def initial_bearing_to(self, other):
+        """Return the initial bearings from self to other."""
+        return geodesy.bearings(*(self.trig_columns()
+                                  + self.trig_columns(other)))
+
+    def distance_to(self, other, threshold=None):
+        """Return the distances from self to other."""
+        lat0, lon0, sin_lat0, cos_lat0 = self.trig_columns()
+        lat1, lon1, sin_lat1, cos_lat1 = self.trig_columns(other)
+        return geodesy.distances(lat0, lon0, cos_lat0, lat1, lon1, cos_lat1,
+                                 threshold)
+
+    def halfway_to(self, other):
+        """Return the points halfway between self and other."""
+        lat1, lon1, ele1 = self.other_columns(other)
+        result = CoordArray()
+        for lat0, lon0, ele0, lat1, lon1, ele1 in izip(self.column('lat'),
+                                                       self.column('lon'),
+                                                       self.column('ele'),
+                                                       lat1, lon1, ele1):
+            bx = cos(lat1) * cos(lon1 - lon0)
+            by = cos(lat1) * sin(lon1 - lon0)
+            cos_lat_plus_bx = cos(lat0) + bx
+            result.lat.append(atan2(sin(lat0) + sin(lat1),
+                                    sqrt(cos_lat_plus_bx * cos_lat_plus_bx
+                                         + by * by)))
+            result.lon.append(lon0 + atan2(by, cos_lat_plus_bx))
+            result.ele.append((ele0 + ele1) / 2.0)
+            result.t.append(NAN)
+        return result
+
+    def interpolate(self, other, delta):
+        """Return the points delta between self and other."""
+        n = len(self)
+        lat, lon = geodesy.interpolate(*(self.trig_columns()
+                                         + self.trig_columns(other)
+                                         + (delta,)))
+        lat1, lon1, ele1 = self.other_columns(other)
+        ele = array('d', ((1.0 - delta) * ele0 + delta * ele1
+                          for ele0, ele1, delta
+                          in izip(self.column('ele'), ele1,
+                                  broadcast(delta, n))))
+        return CoordArray.from_columns(double_array(lat), double_array(lon),
+                                       ele, array('d', [NAN] * n))
+
+    def coord_at(self, theta, d):
+        """Return the points d from self in directions theta."""
+        n = len(self)
+        result = CoordArray(self.ele.typecode)
+        for lat0, lon0, ele0, theta, d in izip(self.column('lat'),
+                                               self.column('lon'),
+                                               self.column('ele'),
+                                               broadcast(theta, n),
+                                               broadcast(d, n)):
+            lat = asin(sin(lat0) * cos(d / R)
+                       + cos(lat0) * sin(d / R) * cos(theta))
+            result.lat.append(lat)
+            result.lon.append(lon0 + atan2(sin(theta) * sin(d / R) * cos(lat0),
+                                           cos(d / R) - sin(lat0) * sin(lat)))
+            result.ele.append(ele0)
+            result.t.append(NAN)
+        return result
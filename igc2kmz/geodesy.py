@@ -0,0 +1,280 @@
+#   igc2kmz geodesy functions
+#   Copyright (C) 2008  Tom Payne
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""Great circle kernels over arrays of points.
+
+Every function takes arrays (or scalars, which are broadcast) of latitudes
+and longitudes in radians together with the sines and cosines of the
+latitudes, so that callers can compute those once per point.  Distances use
+the haversine formula, which unlike the spherical law of cosines keeps its
+precision for points that are close together.  The results are NumPy arrays
+if NumPy is available and arrays of doubles otherwise, and are identical to
+those of the corresponding Coord methods.
+
+Distances can optionally be computed with a threshold, in which case pairs of
+points that differ by less than threshold / R radians in both latitude and
+longitude are measured on a local projection of the sphere, which needs no
+trigonometry.  The error is bounded by max_distance_error.
+
+"""
+
+
+from array import array
+from itertools import izip, repeat
+from math import asin, atan2, cos, sin, sqrt
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+R = 6371000.0
+DISTANCE_THRESHOLD = 1000.0
+
+
+def as_numpy(value):
+    """Return value as a NumPy array, without copying arrays of numbers."""
+    if isinstance(value, array):
+        return numpy.frombuffer(value, value.typecode)
+    return numpy.asarray(value)
+
+
+def sequences(*args):
+    """Return args with scalars repeated to the length of the others."""
+    n = None
+    for arg in args:
+        if not isinstance(arg, (int, long, float)):
+            if n is None:
+                n = len(arg)
+            elif len(arg) != n:
+                raise ValueError('length %d does not match %d' % (len(arg), n))
+    if n is None:
+        n = 1
+    return [repeat(arg, n) if isinstance(arg, (int, long, float)) else arg
+            for arg in args]
+
+
+def angles(lat0, lon0, cos_lat0, lat1, lon1, cos_lat1):
+    """Return the angles subtended by pairs of points."""
+    if numpy is not None:
+        lat0, lon0, cos_lat0, lat1, lon1, cos_lat1 = \
+                map(as_numpy, (lat0, lon0, cos_lat0, lat1, lon1, cos_lat1))
+        s_lat = numpy.sin((lat1 - lat0) / 2.0)
+        s_lon = numpy.sin((lon1 - lon0) / 2.0)
+        a = s_lat * s_lat + cos_lat0 * cos_lat1 * s_lon * s_lon
+        return 2.0 * numpy.arcsin(numpy.sqrt(numpy.minimum(a, 1.0)))
+    result = array('d')
+    for lat0, lon0, cos_lat0, lat1, lon1, cos_lat1 \
+        in izip(*sequences(lat0, lon0, cos_lat0, lat1, lon1, cos_lat1)):
+        s_lat = sin((lat1 - lat0) / 2.0)
+        s_lon = sin((lon1 - lon0) / 2.0)
+        a = s_lat * s_lat + cos_lat0 * cos_lat1 * s_lon * s_lon
+        result.append(2.0 * asin(sqrt(min(a, 1.0))))
+    return result
+
+
+def fast_angles(lat0, lon0, cos_lat0, lat1, lon1, cos_lat1, limit):
+    """Return the angles subtended by pairs of points, approximating those
+    that differ by at most limit in both latitude and longitude."""
+    if numpy is not None:
+        lat0, lon0, cos_lat0, lat1, lon1, cos_lat1 = \
+                numpy.broadcast_arrays(*[numpy.atleast_1d(as_numpy(value))
+                                         for value in (lat0, lon0, cos_lat0,
+                                                       lat1, lon1, cos_lat1)])
+        dlat = lat1 - lat0
+        dlon = lon1 - lon0
+        result = numpy.sqrt(dlat * dlat + cos_lat0 * cos_lat1 * dlon * dlon)
+        far = numpy.flatnonzero((abs(dlat) > limit) | (abs(dlon) > limit))
+        if len(far):
+            result[far] = angles(lat0[far], lon0[far], cos_lat0[far],
+                                 lat1[far], lon1[far], cos_lat1[far])
+        return result
+    result = array('d')
+    for lat0, lon0, cos_lat0, lat1, lon1, cos_lat1 \
+        in izip(*sequences(lat0, lon0, cos_lat0, lat1, lon1, cos_lat1)):
+        dlat = lat1 - lat0
+        dlon = lon1 - lon0
+        if -limit <= dlat <= limit and -limit <= dlon <= limit:
+            result.append(sqrt(dlat * dlat
+                               + cos_lat0 * cos_lat1 * dlon * dlon))
+        else:
+            s_lat = sin(dlat / 2.0)
+            s_lon = sin(dlon / 2.0)
+            a = s_lat * s_lat + cos_lat0 * cos_lat1 * s_lon * s_lon
+            result.append(2.0 * asin(sqrt(min(a, 1.0))))
+    return result
+
+
+def max_distance_error(distance, threshold):
+    """Return the largest error in a distance computed with threshold.
+
+    The local projection replaces the sines and the arcsine in the haversine
+    formula by their arguments.  For points that differ by at most
+    m = threshold / R radians in latitude and longitude this increases the
+    haversine by a factor of at most 1 / (1 - m**2 / 12) and reduces the
+    arcsine by a factor of at most sqrt(1 - m**2 / 2), so the relative error
+    of the distance is at most m**2 / 2.  With the default DISTANCE_THRESHOLD
+    of 1km the error is less than 0.02mm.
+
+    """
+    m = threshold / R
+    return abs(distance) * m * m / 2.0
+
+
+def distances(lat0, lon0, cos_lat0, lat1, lon1, cos_lat1, threshold=None):
+    """Return the distances between pairs of points, approximating those that
+    differ by less than threshold / R radians in both latitude and longitude
+    if threshold is given."""
+    if threshold is None:
+        result = angles(lat0, lon0, cos_lat0, lat1, lon1, cos_lat1)
+    else:
+        result = fast_angles(lat0, lon0, cos_lat0, lat1, lon1, cos_lat1,
+                             threshold / R)
+    if numpy is not None:
+        return R * result
+    return array('d', (R * angle for angle in result))
+
+
+def bearings(lat0, lon0, sin_lat0, cos_lat0, lat1, lon1, sin_lat1, cos_lat1):
+    """Return the initial bearings from the first to the second of pairs of
+    points."""
+    if numpy is not None:
+        lat0, lon0, sin_lat0, cos_lat0, lat1, lon1, sin_lat1, cos_lat1 = \
+                map(as_numpy, (lat0, lon0, sin_lat0, cos_lat0,
+                               lat1, lon1, sin_lat1, cos_lat1))
+        y = numpy.sin(lon1 - lon0) * cos_lat1
+        x = cos_lat0 * sin_lat1 \
+            - sin_lat0 * cos_lat1 * numpy.cos(lon1 - lon0)
+        return numpy.arctan2(y, x)
+    result = array('d')
+    for lon0, sin_lat0, cos_lat0, lon1, sin_lat1, cos_lat1 \
+        in izip(*sequences(lon0, sin_lat0, cos_lat0,
+                           lon1, sin_lat1, cos_lat1)):
+        y = sin(lon1 - lon0) * cos_lat1
+        x = cos_lat0 * sin_lat1 - sin_lat0 * cos_lat1 * cos(lon1 - lon0)
+        result.append(atan2(y, x))
+    return result
+
+
+def interpolate(lat0, lon0, sin_lat0, cos_lat0, lat1, lon1, sin_lat1,
+                cos_lat1, delta):
+    """Return the latitudes and longitudes of the points delta of the way
+    along the great circles between pairs of points."""
+    d = angles(lat0, lon0, cos_lat0, lat1, lon1, cos_lat1)
+    theta = bearings(lat0, lon0, sin_lat0, cos_lat0,
+                     lat1, lon1, sin_lat1, cos_lat1)
+    if numpy is not None:
+        lat0, lon0, sin_lat0, cos_lat0, delta = \
+                map(as_numpy, (lat0, lon0, sin_lat0, cos_lat0, delta))
+        d = delta * d
+        sin_d, cos_d = numpy.sin(d), numpy.cos(d)
+        lat = numpy.arcsin(sin_lat0 * cos_d
+                           + cos_lat0 * sin_d * numpy.cos(theta))
+        lon = lon0 + numpy.arctan2(numpy.sin(theta) * sin_d * cos_lat0,
+                                   cos_d - sin_lat0 * numpy.sin(lat))
+        return (lat, lon)
+    lats, lons = array('d'), array('d')
+    for lon0, sin_lat0, cos_lat0, d, theta, delta \
+        in izip(*sequences(lon0, sin_lat0, cos_lat0, d, theta, delta)):
+        d = delta * d
+        lat = asin(sin_lat0 * cos(d) + cos_lat0 * sin(d) * cos(theta))
+        lats.append(lat)
+        lons.append(lon0 + atan2(sin(theta) * sin(d) * cos_lat0,
+                                 cos(d) - sin_lat0 * sin(lat)))
+    return (lats, lons)
+
+
+class Trig(object):
+    """The latitudes and longitudes of a sequence of points, with the sines
+    and cosines of their latitudes computed once."""
+
+    def __init__(self, coords=()):
+        self.lat = array('d')
+        self.lon = array('d')
+        self.sin_lat = array('d')
+        self.cos_lat = array('d')
+        self.extend(coords)
+
+    def __len__(self):
+        return len(self.lat)
+
+    def extend(self, coords):
+        if hasattr(coords, 'column'):
+            lats, lons = coords.column('lat'), coords.column('lon')
+        else:
+            lats = [coord.lat for coord in coords]
+            lons = [coord.lon for coord in coords]
+        self.lat.extend(lats)
+        self.lon.extend(lons)
+        self.sin_lat.extend(sin(lat) for lat in lats)
+        self.cos_lat.extend(cos(lat) for lat in lats)
+
+    def columns(self, start=0, stop=None):
+        """Return the lat, lon, sin_lat and cos_lat of points start to
+        stop."""
+        if stop is None:
+            stop = len(self.lat)
+        result = (self.lat[start:stop], self.lon[start:stop],
+                  self.sin_lat[start:stop], self.cos_lat[start:stop])
+        if numpy is not None:
+            return [numpy.frombuffer(column) for column in result]
+        return result
+
+    def take(self, indexes):
+        """Return the lat, lon, sin_lat and cos_lat of points indexes."""
+        if numpy is not None:
+            indexes = numpy.asarray(indexes, dtype=int)
+            return [numpy.frombuffer(column)[indexes]
+                    for column in (self.lat, self.lon, self.sin_lat,
+                                   self.cos_lat)]
+        return [array('d', (column[i] for i in indexes))
+                for column in (self.lat, self.lon, self.sin_lat,
+                               self.cos_lat)]
+
+    def distances(self, start=0, stop=None, threshold=None):
+        """Return the distances between consecutive points from start to
+        stop."""
+        lat, lon, sin_lat, cos_lat = self.columns(start, stop)
+        return distances(lat[:-1], lon[:-1], cos_lat[:-1],
+                         lat[1:], lon[1:], cos_lat[1:], threshold)
+
+    def distances_to(self, coord, start=0, stop=None, threshold=None):
+        """Return the distances from the points start to stop to coord."""
+        lat, lon, sin_lat, cos_lat = self.columns(start, stop)
+        return distances(lat, lon, cos_lat,
+                         coord.lat, coord.lon, cos(coord.lat), threshold)
+
+    def bearings(self, start=0, stop=None):
+        """Return the initial bearings between consecutive points from start
+        to stop."""
+        lat, lon, sin_lat, cos_lat = self.columns(start, stop)
+        return bearings(lat[:-1], lon[:-1], sin_lat[:-1], cos_lat[:-1],
+                        lat[1:], lon[1:], sin_lat[1:], cos_lat[1:])
+
+    def interpolate(self, indexes, delta):
+        """Return the latitudes and longitudes of the points delta of the
+        way from the points at indexes to the points after them."""
+        if numpy is not None:
+            indexes = numpy.asarray(indexes, dtype=int)
+            next_indexes = indexes + 1
+        else:
+            next_indexes = [i + 1 for i in indexes]
+        lat0, lon0, sin_lat0, cos_lat0 = self.take(indexes)
+        lat1, lon1, sin_lat1, cos_lat1 = self.take(next_indexes)
+        return interpolate(lat0, lon0, sin_lat0, cos_lat0,
+                           lat1, lon1, sin_lat1, cos_lat1, delta)
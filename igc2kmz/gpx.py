@@ -15,7 +15,7 @@
 #   along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 
-from datetime import datetime
+import calendar
 import math
 import re
 try:
@@ -29,6 +29,15 @@ from waypoint import Waypoint
 
 
 GPX_DATETIME_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
+GPX_DATETIME_RE = re.compile(r'(\d{4})-(\d\d)-(\d\d)T(\d\d):(\d\d):(\d\d)Z\Z')
+
+
+def parse_time(text):
+    """Return the GPX time text in seconds since the UTC epoch."""
+    m = GPX_DATETIME_RE.match(text)
+    if not m:
+        raise ValueError('invalid GPX time %r' % text)
+    return calendar.timegm(map(int, m.groups()))
 
 
 class gpx_tag(object):
@@ -53,11 +62,14 @@ class gpx_tag(object):
 
 class GPX(object):
 
-    def __init__(self, file):
-        try:
-            self.filename = file.name
-        except AttributeError:
-            self.filename = '(unknown)'
+    def __init__(self, file, filename=None):
+        if filename:
+            self.filename = filename
+        else:
+            try:
+                self.filename = file.name
+            except AttributeError:
+                self.filename = '(unknown)'
         element = parse(file)
         namespace = re.match('\{(.*)\}', element.getroot().tag).group(1)
         ele_tag_name = '{%s}ele' % namespace
@@ -73,8 +85,7 @@ class GPX(object):
             time = trkpt.find(time_tag_name)
             if time is None:
                 continue
-            dt = datetime.strptime(time.text, GPX_DATETIME_FORMAT)
-            coord = Coord(lat, lon, ele, dt)
+            coord = Coord(lat, lon, ele, t=parse_time(time.text))
             self.coords.append(coord)
         self.waypoints = []
         for wpt in element.findall('/{%s}wpt' % namespace):
@@ -86,5 +97,5 @@ class GPX(object):
             waypoint = Waypoint(name, lat, lon, ele)
             self.waypoints.append(waypoint)
 
-    def track(self):
-        return Track(self.coords, filename=self.filename)
+    def track(self, **kwargs):
+        return Track(self.coords, filename=self.filename, **kwargs)
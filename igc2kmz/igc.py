@@ -15,12 +15,17 @@
 #   along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 
+from array import array
+import calendar
+from collections import deque
 import datetime
+from itertools import izip
 import logging
+from math import pi
 import os.path
 import re
 
-from coord import Coord
+from coord import Coord, CoordArray
 from task import Task, Turnpoint
 import track
 
@@ -40,6 +45,8 @@ L_RECORD_RE = re.compile(r'L(.*)\Z')
 
 NOT_SET_RE = re.compile(r'\s*(not\s+set|n/?a)?\s*\Z', re.I)
 
+NAN = float('nan')
+
 
 class_by_letter = {}
 
@@ -87,40 +94,168 @@ class ARecord(Record):
 class BRecord(Record):
 
     @classmethod
-    def parse(cls, line, igc):
-        result = cls()
+    def fields(cls, line):
+        """Return the fixed-column fields of a B record.
+
+        Well-formed records are sliced directly at the columns defined by the
+        IGC specification.  Anything that fails the cheap character checks
+        (negative altitudes, short or corrupt lines) is handed to fields_re.
+
+        """
+        if len(line) >= 35 and line[1:14].isdigit() and line[14] in 'NS' \
+           and line[15:23].isdigit() and line[23] in 'EW' \
+           and line[24] in 'AV' and line[25:35].isdigit():
+            hms = int(line[1:7])
+            lat = int(line[7:14])
+            lon = int(line[15:23])
+            return (hms // 10000, hms // 100 % 100, hms % 100,
+                    lat // 100000, lat % 100000, line[14],
+                    lon // 100000, lon % 100000, line[23],
+                    line[24], int(line[25:30]), int(line[30:35]))
+        return cls.fields_re(line)
+
+    @classmethod
+    def fields_re(cls, line):
+        """Return the fields of a B record using B_RECORD_RE."""
         m = B_RECORD_RE.match(line)
         if not m:
             raise SyntaxError, line
+        return (int(m.group(1)), int(m.group(2)), int(m.group(3)),
+                int(m.group(4)), int(m.group(5)), m.group(6),
+                int(m.group(7)), int(m.group(8)), m.group(9),
+                m.group(10), int(m.group(11)), int(m.group(12)))
+
+    @classmethod
+    def parse(cls, line, igc):
+        hour, minute, second, lat_deg, lat_min, ns, lon_deg, lon_min, ew, \
+                validity, alt, ele = cls.fields(line)
+        extensions = {}
         for key, value in igc.i.items():
             try:
-                setattr(result, key, int(line[value]))
+                extensions[key] = int(line[value])
             except ValueError:
-                setattr(result, key, None)
-        time = datetime.time(*map(int, m.group(1, 2, 3)))
+                extensions[key] = NAN
+        t = igc.hfdterecord.t + 3600 * hour + 60 * minute + second
         if 'tds' in igc.i:
-            time = time.replace(microsecond=int(line[igc.i['tds']]) * 100000)
-        result.dt = datetime.datetime.combine(igc.hfdterecord.date, time)
-        if igc.b and result.dt < igc.b[-1].dt:
+            t += int(line[igc.i['tds']]) / 10.0
+        if igc.b and t < igc.b.t[-1]:
             igc.hfdterecord.date = datetime.date.fromordinal(
                     igc.hfdterecord.date.toordinal() + 1)
-            result.dt = datetime.datetime.combine(igc.hfdterecord.date, time)
-        result.lat = int(m.group(4)) + int(m.group(5)) / 60000.0
+            igc.hfdterecord.t += 86400
+            t += 86400
+        lat = lat_deg + lat_min / 60000.0
         if 'lad' in igc.i:
-            result.lat += int(line[igc.i['lad']]) / 6000000.0
-        if m.group(6) == 'S':
-            result.lat *= -1
-        result.lon = int(m.group(7)) + int(m.group(8)) / 60000.0
+            lat += int(line[igc.i['lad']]) / 6000000.0
+        if ns == 'S':
+            lat *= -1
+        lon = lon_deg + lon_min / 60000.0
         if 'lod' in igc.i:
-            result.lon += int(line[igc.i['lod']]) / 6000000.0
-        if m.group(9) == 'W':
-            result.lon *= -1
-        result.validity = m.group(10)
-        result.alt = int(m.group(11))
-        result.ele = int(m.group(12))
-        igc.b.append(result)
+            lon += int(line[igc.i['lod']]) / 6000000.0
+        if ew == 'W':
+            lon *= -1
+        igc.b.append(t, lat, lon, validity, alt, ele, extensions)
+        return None
+
+
+class BRecordArray(object):
+    """A columnar store of B records.
+
+    Each field is held in its own typed array: t is seconds since the UTC
+    epoch, lat and lon are in degrees, and every I record extension has its
+    own column in extensions, with NAN marking values that could not be
+    parsed.  BRecord objects are only created when indexed.
+
+    """
+
+    def __init__(self):
+        self.t = array('d')
+        self.lat = array('d')
+        self.lon = array('d')
+        self.validity = array('c')
+        self.alt = array('i')
+        self.ele = array('i')
+        self.extensions = {}
+
+    def __len__(self):
+        return len(self.t)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            result = BRecordArray()
+            for key, column in self.extensions.items():
+                result.extensions[key] = column[index]
+            result.t = self.t[index]
+            result.lat = self.lat[index]
+            result.lon = self.lon[index]
+            result.validity = self.validity[index]
+            result.alt = self.alt[index]
+            result.ele = self.ele[index]
+            return result
+        result = BRecord()
+        for key, column in self.extensions.items():
+            value = column[index]
+            setattr(result, key, None if value != value else int(value))
+        result.dt = datetime.datetime.utcfromtimestamp(self.t[index])
+        result.lat = self.lat[index]
+        result.lon = self.lon[index]
+        result.validity = self.validity[index]
+        result.alt = self.alt[index]
+        result.ele = self.ele[index]
         return result
 
+    def __delitem__(self, index):
+        for column in self.extensions.values():
+            del column[index]
+        del self.t[index]
+        del self.lat[index]
+        del self.lon[index]
+        del self.validity[index]
+        del self.alt[index]
+        del self.ele[index]
+
+    def coords(self, ele=None):
+        """Return the fixes as Coords.
+
+        If ele is true then the GNSS altitude is used, if it is false then the
+        pressure altitude is used, and if it is None then the GNSS altitude
+        is used unless it is always zero.
+
+        """
+        if ele is None:
+            ele = any(self.ele)
+        return [Coord.deg(lat, lon, e, t=t)
+                for t, lat, lon, e in izip(self.t, self.lat, self.lon,
+                                           self.ele if ele else self.alt)]
+
+    def coord_array(self, ele=None):
+        """Return the fixes as a CoordArray, choosing the altitude as coords
+        does."""
+        if ele is None:
+            ele = any(self.ele)
+        return CoordArray.from_columns(array('d', (pi * lat / 180.0
+                                                   for lat in self.lat)),
+                                       array('d', (pi * lon / 180.0
+                                                   for lon in self.lon)),
+                                       array('l', self.ele if ele
+                                                  else self.alt),
+                                       self.t[:])
+
+    def append(self, t, lat, lon, validity, alt, ele, extensions={}):
+        for key, value in extensions.items():
+            if key not in self.extensions:
+                self.extensions[key] = array('d', [NAN] * len(self.t))
+            self.extensions[key].append(value)
+        if len(extensions) != len(self.extensions):
+            for key, column in self.extensions.items():
+                if key not in extensions:
+                    column.append(NAN)
+        self.t.append(t)
+        self.lat.append(lat)
+        self.lon.append(lon)
+        self.validity.append(validity)
+        self.alt.append(alt)
+        self.ele.append(ele)
+
 
 class CRecord(Record):
 
@@ -185,6 +320,7 @@ class HRecord(Record):
                 result.date = datetime.date(2000 + year, month, day)
             except ValueError:
                 raise SyntaxError, line
+            result.t = calendar.timegm(result.date.timetuple())
             igc.hfdterecord = result
             return result
         m = HFFXA_RECORD_RE.match(line)
@@ -229,24 +365,28 @@ class LRecord(Record):
 
 class IGC(object):
 
-    def __init__(self, file, date=None):
-        try:
-            self.filename = file.name
-        except AttributeError:
-            self.filename = '(unknown)'
-        self.b = []
+    def __init__(self, file, date=None, filename=None):
+        if filename:
+            self.filename = filename
+        else:
+            try:
+                self.filename = file.name
+            except AttributeError:
+                self.filename = '(unknown)'
+        self.b = BRecordArray()
         self.c = []
         self.g = []
         self.h = {}
         self.i = {}
         self.l = []
         self.records = []
+        self.invalid = []
         if date:
             HRecord.parse(date.strftime('HFDTE%d%m%y'), self)
         for line in file:
+            line = line.rstrip()
             try:
-                line = line.rstrip()
-                letter = line[0]
+                letter = line[:1]
                 if letter in class_by_letter:
                     klass = class_by_letter[letter]
                     record = klass.parse(line, self)
@@ -255,22 +395,17 @@ class IGC(object):
             except SyntaxError:
                 logging.warning('%s: invalid record %s'
                                 % (self.filename, repr(line)))
-
-    def track(self):
-        ele = 'ele' if any(b.ele for b in self.b) else 'alt'
-        coords = [Coord.deg(b.lat, b.lon, getattr(b, ele), b.dt)
-                  for b in self.b]
-        kwargs = {}
-        kwargs['filename'] = os.path.basename(self.filename)
-        if 'plt' in self.h and not NOT_SET_RE.match(self.h['plt']):
-            kwargs['pilot_name'] = self.h['plt'].strip()
-        if 'gty' in self.h and not NOT_SET_RE.match(self.h['gty']):
-            kwargs['glider_type'] = self.h['gty'].strip()
-        if 'gid' in self.h and not NOT_SET_RE.match(self.h['gid']):
-            kwargs['glider_id'] = self.h['gid'].strip()
-        for k in self.i.keys():
-            if any(getattr(b, k) for b in self.b):
-                kwargs[k] = [getattr(b, k) for b in self.b]
+                self.invalid.append(line)
+
+    def track(self, **kwargs):
+        b = self.b
+        coords = b.coord_array()
+        kwargs.update(track_kwargs(self.filename, self.h))
+        for k, column in b.extensions.items():
+            values = [None if value != value else int(value)
+                      for value in column]
+            if any(values):
+                kwargs[k] = values
         if self.c:
             tps = [Turnpoint(c.name, Coord.deg(c.lat, c.lon, 0), 0)
                    for c in self.c]
@@ -278,6 +413,239 @@ class IGC(object):
         return track.Track(coords, **kwargs)
 
 
+def track_kwargs(filename, h):
+    """Return the Track keyword arguments for filename and H records h."""
+    kwargs = {}
+    kwargs['filename'] = os.path.basename(filename)
+    if 'plt' in h and not NOT_SET_RE.match(h['plt']):
+        kwargs['pilot_name'] = h['plt'].strip()
+    if 'gty' in h and not NOT_SET_RE.match(h['gty']):
+        kwargs['glider_type'] = h['gty'].strip()
+    if 'gid' in h and not NOT_SET_RE.match(h['gid']):
+        kwargs['glider_id'] = h['gid'].strip()
+    return kwargs
+
+
+class FixState(object):
+    """The bounded parser state needed to decode a stream of B records.
+
+    This is the subset of IGC that HRecord, IRecord and BRecord use: the
+    header values, the I record extension slices, the flight date and, in b,
+    the last fix seen (for midnight rollover).
+
+    """
+
+    def __init__(self, filename='(unknown)'):
+        self.filename = filename
+        self.b = BRecordArray()
+        self.h = {}
+        self.i = {}
+
+
+def iter_fixes(file, date=None):
+    """Yield the fixes in file one at a time.
+
+    Each fix is a BRecord.  Only H, I and B records are decoded, and only the
+    state in FixState is kept between fixes, so arbitrarily large files can
+    be processed in constant memory.
+
+    """
+    try:
+        state = FixState(file.name)
+    except AttributeError:
+        state = FixState()
+    if date:
+        HRecord.parse(date.strftime('HFDTE%d%m%y'), state)
+    for line in file:
+        line = line.rstrip()
+        letter = line[:1]
+        try:
+            if letter == 'B':
+                BRecord.parse(line, state)
+                yield state.b[-1]
+                del state.b[:-1]
+            elif letter == 'H':
+                HRecord.parse(line, state)
+            elif letter == 'I':
+                IRecord.parse(line, state)
+        except SyntaxError:
+            logging.warning('%s: invalid record %s'
+                            % (state.filename, repr(line)))
+
+
+class Tail(object):
+    """Incrementally read the fixes appended to a growing IGC file.
+
+    The byte offset of the first incomplete line and the FixState are kept
+    between reads, so each read only decodes the records written since the
+    last one.  As in BRecordArray.coords, the GNSS altitude is used unless
+    it has always been zero, so the track is built with pressure altitude
+    until a non-zero GNSS altitude is read and then rebuilt from every fix.
+
+    """
+
+    def __init__(self, filename, date=None):
+        self.filename = filename
+        self.offset = 0
+        self.state = FixState(filename)
+        if date:
+            HRecord.parse(date.strftime('HFDTE%d%m%y'), self.state)
+        self.ele = None
+        self.coords = []
+        self.track = None
+
+    def read(self):
+        """Return a BRecordArray of the fixes appended since the last read."""
+        file = open(self.filename, 'rb')
+        try:
+            file.seek(self.offset)
+            data = file.read()
+        finally:
+            file.close()
+        size = data.rfind('\n') + 1
+        self.offset += size
+        # Keep every fix until the altitude is decided, in case the track
+        # needs rebuilding
+        if self.ele is not None:
+            del self.state.b[:-1]
+        count = len(self.state.b)
+        for line in data[:size].splitlines():
+            line = line.rstrip()
+            letter = line[:1]
+            try:
+                if letter == 'B':
+                    BRecord.parse(line, self.state)
+                elif letter == 'H':
+                    HRecord.parse(line, self.state)
+                elif letter == 'I':
+                    IRecord.parse(line, self.state)
+            except SyntaxError:
+                logging.warning('%s: invalid record %s'
+                                % (self.filename, repr(line)))
+        return self.state.b[count:]
+
+    def update(self):
+        """Read any new fixes, append them to self.track and return it.
+
+        The track is created once at least two fixes have been read, and
+        until then None is returned.
+
+        """
+        b = self.read()
+        if len(b) == 0:
+            return self.track
+        if self.ele is None:
+            if any(b.ele):
+                self.ele = True
+                coords = self.state.b.coords(self.ele)
+                self.coords = []
+                self.track = None
+            else:
+                coords = b.coords(False)
+        else:
+            coords = b.coords(self.ele)
+        if self.track is not None:
+            self.track.extend(coords)
+        else:
+            self.coords.extend(coords)
+            if len(self.coords) >= 2:
+                kwargs = track_kwargs(self.filename, self.state.h)
+                self.track = track.Track(self.coords, **kwargs)
+                self.coords = []
+        return self.track
+
+
+class Summary(object):
+    """A summary of an IGC file: its A and H records and first and last fix."""
+
+    def __init__(self, filename, a, h, first, last):
+        self.filename = filename
+        self.a = a
+        self.h = h
+        self.first = first
+        self.last = last
+
+    def __repr__(self):
+        return 'Summary(%s)' \
+               % ', '.join('%s=%s' % (key, repr(value))
+                           for key, value in self.__dict__.items())
+
+
+def scan(file, date=None, chunk_size=4096):
+    """Return a Summary of file without decoding all of its B records.
+
+    Records are read up to and including the first B record.  If file is
+    seekable then the last fix is found by reading backwards from the end of
+    the file in chunk_size pieces, otherwise the remaining lines are skipped
+    without being decoded and only the last few B records are kept.
+    Midnight rollover is only detected between the first and last fix, so
+    flights lasting more than a day are not handled.
+
+    """
+    try:
+        state = FixState(file.name)
+    except AttributeError:
+        state = FixState()
+    if date:
+        HRecord.parse(date.strftime('HFDTE%d%m%y'), state)
+    first = None
+    while True:
+        line = file.readline()
+        if not line:
+            break
+        line = line.rstrip()
+        letter = line[:1]
+        try:
+            if letter == 'A':
+                ARecord.parse(line, state)
+            elif letter == 'B':
+                BRecord.parse(line, state)
+                first = state.b[0]
+                break
+            elif letter == 'H':
+                HRecord.parse(line, state)
+            elif letter == 'I':
+                IRecord.parse(line, state)
+        except SyntaxError:
+            logging.warning('%s: invalid record %s'
+                            % (state.filename, repr(line)))
+    a = getattr(state, 'a', None)
+    if first is None:
+        return Summary(state.filename, a, state.h, None, None)
+    try:
+        start = file.tell()
+        file.seek(0, 2)
+        lines = _reversed_lines(file, start, chunk_size)
+    except (AttributeError, IOError, ValueError):
+        lines = deque((l for l in iter(file.readline, '') if l[:1] == 'B'), 16)
+        lines.reverse()
+    for line in lines:
+        line = line.rstrip()
+        if line[:1] != 'B':
+            continue
+        try:
+            BRecord.parse(line, state)
+            return Summary(state.filename, a, state.h, first, state.b[-1])
+        except SyntaxError:
+            pass
+    return Summary(state.filename, a, state.h, first, first)
+
+
+def _reversed_lines(file, start, chunk_size):
+    """Yield the lines in file between start and the end in reverse order."""
+    position = file.tell()
+    tail = ''
+    while position > start:
+        size = min(chunk_size, position - start)
+        position -= size
+        file.seek(position)
+        lines = (file.read(size) + tail).split('\n')
+        tail = lines.pop(0)
+        for line in reversed(lines):
+            yield line
+    yield tail
+
+
 if __name__ == '__main__':
     import sys
     print repr(IGC(sys.stdin).__dict__)
@@ -15,7 +15,9 @@
 #   along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 
+from itertools import izip
 from math import acos, ceil, pi
+import time
 
 
 class_by_name = {}
@@ -150,14 +152,14 @@ class CDATA(object):
 
 
 class dateTime(object):
-    """A KML dateTime."""
+    """A KML dateTime, from seconds since the UTC epoch."""
 
     def __init__(self, value):
         self.value = value
 
     def __str__(self):
         """Return the KML representation of self."""
-        return self.value.strftime('%Y-%m-%dT%H:%M:%SZ')
+        return time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(self.value))
 
 
 class altitude(_SimpleElement): pass
@@ -180,7 +182,14 @@ class color(_SimpleElement):
 class coordinates(_SimpleElement):
 
     def __init__(self, coords):
-        texts = ('%f,%f,%d' % (c.lon_deg, c.lat_deg, c.ele) for c in coords)
+        if hasattr(coords, 'column'):
+            texts = ('%f,%f,%d' % (180.0 * lon / pi, 180.0 * lat / pi, ele)
+                     for lat, lon, ele in izip(coords.column('lat'),
+                                               coords.column('lon'),
+                                               coords.column('ele')))
+        else:
+            texts = ('%f,%f,%d' % (c.lon_deg, c.lat_deg, c.ele)
+                     for c in coords)
         _SimpleElement.__init__(self, ' '.join(texts))
 
     @classmethod
@@ -221,6 +230,7 @@ class Data(_CompoundElement):
 
 class description(_SimpleElement): pass
 class Document(_CompoundElement): pass
+class east(_SimpleElement): pass
 class end(_SimpleElement): pass
 
 
@@ -289,24 +299,31 @@ class kml(_CompoundElement):
 
 class LabelStyle(_CompoundElement): pass
 class latitude(_SimpleElement): pass
+class LatLonAltBox(_CompoundElement): pass
 class LineString(_CompoundElement): pass
 class LineStyle(_CompoundElement): pass
 class ListStyle(_CompoundElement): pass
 class listItemType(_SimpleElement): pass
+class Lod(_CompoundElement): pass
 class longitude(_SimpleElement): pass
+class maxLodPixels(_SimpleElement): pass
+class minLodPixels(_SimpleElement): pass
 class MultiGeometry(_CompoundElement): pass
 class name(_SimpleElement): pass
+class north(_SimpleElement): pass
 class open(_SimpleElement): pass
 class overlayXY(_SimpleElement): pass
 class Placemark(_CompoundElement): pass
 class Point(_CompoundElement): pass
 class PolyStyle(_CompoundElement): pass
+class Region(_CompoundElement): pass
 class roll(_SimpleElement): pass
 class scale(_SimpleElement): pass
 class ScreenOverlay(_CompoundElement): pass
 class screenXY(_SimpleElement): pass
 class size(_SimpleElement): pass
 class Snippet(_SimpleElement): pass
+class south(_SimpleElement): pass
 
 
 class Style(_CompoundElement):
@@ -323,6 +340,7 @@ class tilt(_SimpleElement): pass
 class TimeSpan(_CompoundElement): pass
 class value(_SimpleElement): pass
 class visibility(_SimpleElement): pass
+class west(_SimpleElement): pass
 class when(_SimpleElement): pass
 class width(_SimpleElement): pass
 
@@ -15,10 +15,6 @@
 #   along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 
-import datetime
-import itertools
-import time
-
 import util
 
 
@@ -99,36 +95,38 @@ class ZeroCenteredScale(Scale):
 
 
 class TimeScale(Scale):
+    """A scale of seconds since the UTC epoch, labelled in local time
+    tz_offset seconds ahead of UTC."""
 
     def __init__(self, range, title=None, gradient=None, step=1,
-                 max_divisions=16, tz_offset=datetime.timedelta(0, 0)):
+                 max_divisions=16, tz_offset=0):
         def steps(step=None):
             steps = [1, 5, 15, 30, 60,
                      5 * 60, 15 * 60, 30 * 60,
-                     3600, 3 * 3600, 6 * 3600, 12 * 3600]
-            return itertools.imap(lambda s: datetime.timedelta(0, s),
-                                  itertools.dropwhile(lambda s: s < step,
-                                                      steps))
+                     3600, 3 * 3600, 6 * 3600, 12 * 3600,
+                     86400, 2 * 86400, 7 * 86400, 14 * 86400]
+            return [s for s in steps if s >= step] or [step]
         lower, upper = range
         if step:
+            # Fall back to the largest step if none gives few enough divisions
             for step in steps(step):
-                lower = util.datetime_floor(range[0], step)
-                upper = util.datetime_floor(range[1], step)
+                lower = util.time_floor(range[0], step)
+                upper = util.time_floor(range[1], step)
                 if upper < range[1]:
                     upper += step
-                if (upper - lower).seconds / step.seconds < max_divisions:
-                    range = (int(time.mktime(lower.timetuple())),
-                             int(time.mktime(upper.timetuple())))
-                    self.grid_step = '%.1f' % (100.0 * step.seconds
-                                               / (upper - lower).seconds)
-                    self.step = step
+                if (upper - lower) / step < max_divisions:
                     break
+            range = (lower, upper)
+            self.grid_step = '%.1f' % (100.0 * step / (upper - lower))
+            self.step = step
         Scale.__init__(self, range, title=title, gradient=gradient, step=None)
         self.labels, self.positions = [], []
-        t = datetime.datetime(lower.year, lower.month, lower.day, lower.hour) \
-            + self.step
+        format = '%H:%M' if self.step < 86400 else '%Y-%m-%d'
+        t = util.time_floor(lower, 3600) + self.step
+        while t < lower:
+            t += self.step
         while t < upper:
-            self.labels.append((t + tz_offset).strftime('%H:%M'))
-            self.positions.append('%1.f' % (100.0 * (t - lower).seconds
-                                            / (upper - lower).seconds))
+            self.labels.append(util.strftime(format, t + tz_offset))
+            self.positions.append('%1.f' % (100.0 * (t - lower)
+                                            / (upper - lower)))
             t += self.step
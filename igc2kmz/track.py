@@ -15,8 +15,18 @@
 #   along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 
-import time
+import bisect
+from itertools import izip
+from math import cos
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from coord import Coord, CoordArray
+import geodesy
+from geodesy import Trig
 import util
 
 
@@ -25,148 +35,753 @@ THERMAL = 1
 GLIDE = 2
 DIVE = 3
 
+# The width, in seconds, of the window that the track is analysed over
+WINDOW = 20
+# The attributes computed on first use by measure, analyse, classify, index
+# and simplify
+MEASURED = ('s', 'ele', 'dz_positive', 'dz_negative', 'total_dz_positive',
+            'max_dz_positive', 'min_ele', 'elevation_data', 'bounds')
+# The series computed over windows, each on its own first use, where series
+# holds all of the WINDOWED series over the extra windows
+WINDOWED = ('speed', 'climb', 'tec', 'progress')
+SERIES = WINDOWED + ('series',)
+ANALYSED = ('window', 'widths') + SERIES
+CLASSIFIED = ('state', 'runs', 'thermals', 'glides', 'dives')
+INDEXED = ('climb_index', 'vs_index')
+SIMPLIFIED = ('lod',)
+# The tolerances, in metres, of the coarser levels of detail
+LOD_TOLERANCES = (10.0, 40.0, 160.0)
+# Below this many new values the pure Python code is faster than NumPy
+NUMPY_THRESHOLD = 64
+# The number of consecutive plausible fixes that anchor the start of a track
+ANCHOR_LENGTH = 5
+
+
+def whole_seconds(dt):
+    """Return the whole seconds in the positive interval dt, which is
+    accurate to the microsecond, modulo a day."""
+    return int(dt + 0.0000005) % 86400
+
+
+def whole_times(coords):
+    """Return the times of coords in whole seconds since the UTC epoch."""
+    if isinstance(coords, CoordArray):
+        return [int(t) for t in coords.column('t')]
+    return [int(c.t) for c in coords]
+
+
+def rejection(c0, c1, threshold=None):
+    """Return why c1 cannot follow c0 ('time', 'speed' or 'climb'), or None
+    if it can."""
+    if c1.t <= c0.t:
+        return 'time'
+    dt = whole_seconds(c1.t - c0.t)
+    if dt == 0:
+        return 'time'
+    if c0.distance_to(c1, threshold) / dt > 100.0:
+        return 'speed'
+    dz = c1.ele - c0.ele
+    if dz / dt < -30.0 or 30.0 < dz / dt:
+        return 'climb'
+    return None
+
+
+def numpy_column(coords, name, dtype=float):
+    """Return the attribute name of each of coords as an array."""
+    if isinstance(coords, CoordArray):
+        column = coords.column(name)
+        return numpy.frombuffer(column, column.typecode).astype(dtype)
+    return numpy.fromiter((getattr(c, name) for c in coords), dtype,
+                          len(coords))
+
+
+def numpy_rejections(coords, threshold=None):
+    """Return the indexes i for which coords[i] cannot follow coords[i - 1],
+    as rejection."""
+    lat = numpy_column(coords, 'lat')
+    lon = numpy_column(coords, 'lon')
+    if isinstance(coords, CoordArray):
+        column = coords.column('ele')
+        ele = numpy.frombuffer(column, column.typecode)
+    else:
+        ele = numpy.array([c.ele for c in coords])
+    us = numpy.round(numpy_column(coords, 't') * 1000000)
+    dus = numpy.diff(us.astype(numpy.int64))
+    dt = dus // 1000000 % 86400
+    cos_lat = numpy.cos(lat)
+    ds = geodesy.distances(lat[:-1], lon[:-1], cos_lat[:-1],
+                           lat[1:], lon[1:], cos_lat[1:], threshold)
+    dz = numpy.diff(ele)
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        bad = (dus <= 0) | (dt == 0) | (ds / dt > 100.0) \
+              | (dz / dt < -30.0) | (30.0 < dz / dt)
+    return (numpy.flatnonzero(bad) + 1).tolist()
+
+
+def column_rejections(coords, threshold=None):
+    """Return the indexes i for which coords[i] cannot follow coords[i - 1],
+    as numpy_rejections, for a CoordArray without NumPy."""
+    lat, lon, ele, t = [coords.column(name)
+                        for name in ('lat', 'lon', 'ele', 't')]
+    cos_lat = [cos(value) for value in lat]
+    ds = geodesy.distances(lat[:-1], lon[:-1], cos_lat[:-1],
+                           lat[1:], lon[1:], cos_lat[1:], threshold)
+    bad = []
+    for i in xrange(1, len(t)):
+        if t[i] <= t[i - 1]:
+            bad.append(i)
+            continue
+        dt = whole_seconds(t[i] - t[i - 1])
+        if dt == 0 or ds[i - 1] / dt > 100.0 \
+           or not -30.0 <= (ele[i] - ele[i - 1]) / dt <= 30.0:
+            bad.append(i)
+    return bad
+
 
 class Track(object):
+    """A filtered track.
+
+    The attributes in MEASURED, ANALYSED and CLASSIFIED are computed when
+    they are first used and kept up to date by extend from then on, so
+    callers that only need the coordinates and times do not pay for the
+    analysis.  Each of the SERIES is computed separately, and its bounds are
+    added to bounds when it is.  The attributes in INDEXED and SIMPLIFIED
+    are computed when they are first used and discarded by extend.
+
+    """
+
+    # Distances between points that differ by less than distance_threshold / R
+    # radians in both latitude and longitude are approximated, see
+    # geodesy.max_distance_error, if it is set
+    distance_threshold = None
+    # The widths, in whole seconds, of extra windows to compute speed, climb,
+    # tec and progress over, stored in series by width
+    windows = ()
 
     def __init__(self, coords, **kwargs):
-        self.coords = Track.filter(coords)
-        self.t = [int(time.mktime(c.dt.timetuple())) for c in self.coords]
         self.pilot_name = None
         self.glider_type = None
         self.glider_id = None
         self.declaration = None
         self.__dict__.update(kwargs)
-        self.analyse(20)
+        self.rejected = []
+        self.coords = Track.filter(coords, rejected=self.rejected,
+                                   threshold=self.distance_threshold)
+        self.input_length = len(coords)
+        self.trig = Trig(self.coords)
+        self.t = whole_times(self.coords)
+        self.measured = self.analysed = 0
+        self.classified = False
+
+    def __getattr__(self, name):
+        if name in MEASURED:
+            self.measure()
+        elif name in ANALYSED:
+            self.require([name] if name in SERIES else [])
+        elif name in CLASSIFIED:
+            self.classify(0)
+        elif name in INDEXED:
+            self.index()
+        elif name in SIMPLIFIED:
+            self.simplify()
+        else:
+            raise AttributeError(name)
+        return self.__dict__[name]
 
     @classmethod
-    def filter(self, coords):
-        """Filter out erroneous points."""
+    def filter(self, coords, last_c=None, rejected=None, offset=0,
+               threshold=None):
+        """Filter out erroneous points.
+
+        If last_c is given then coords are assumed to follow it and are
+        filtered relative to it, and it is not included in the result.
+        Otherwise the track starts at the first run of ANCHOR_LENGTH
+        consecutive plausible points, and the points before it are filtered
+        backwards from there.  The indexes of rejected points, plus offset,
+        and the reasons for their rejection are appended to rejected.
+        Distances are computed with threshold, as Coord.distance_to.
+
+        """
         # TODO replace with Kahlman filter?
-        # TODO cope with erroneous points at start of track
-        result = [coords[0]]
-        last_c = coords[0]
-        for c in coords:
-            if c.dt <= last_c.dt:
+        if rejected is None:
+            rejected = []
+        original = coords
+        if last_c is not None:
+            coords = [last_c] + list(coords)
+            offset -= 1
+        n = len(coords)
+        if n == 0:
+            return original[:0]
+        # Check consecutive points in bulk, so only the points around
+        # rejections need to be checked one by one
+        if numpy is not None and n >= NUMPY_THRESHOLD:
+            bad = numpy_rejections(coords, threshold)
+        elif isinstance(coords, CoordArray):
+            bad = column_rejections(coords, threshold)
+        else:
+            bad = []
+            for i in xrange(1, n):
+                c0, c1 = coords[i - 1], coords[i]
+                if c1.t <= c0.t:
+                    bad.append(i)
+                    continue
+                dt = whole_seconds(c1.t - c0.t)
+                if dt == 0 or c0.distance_to(c1, threshold) / dt > 100.0 \
+                   or not -30.0 <= (c1.ele - c0.ele) / dt <= 30.0:
+                    bad.append(i)
+        anchor = 0
+        if last_c is None:
+            for i in bad:
+                if i > anchor + ANCHOR_LENGTH:
+                    break
+                # A point that is out of sequence does not cast doubt on the
+                # points before it
+                if rejection(coords[i - 1], coords[i], threshold) != 'time':
+                    anchor = i
+            if anchor >= n - 1:
+                anchor = 0
+        keep, leading = [], []
+        last = anchor
+        for i in xrange(anchor - 1, -1, -1):
+            reason = rejection(coords[i], coords[last], threshold)
+            if reason:
+                leading.append((offset + i, reason))
+            else:
+                keep.append(i)
+                last = i
+        keep.reverse()
+        rejected.extend(reversed(leading))
+        if last_c is None:
+            keep.append(anchor)
+        last = i = anchor
+        bad = iter(bad)
+        next_bad = anchor
+        while True:
+            if last == i:
+                # Points up to the next consecutive rejection are plausible
+                while next_bad <= i:
+                    next_bad = next(bad, n)
+                keep.extend(xrange(i + 1, next_bad))
+                last = i = next_bad - 1
+            i += 1
+            if i >= n:
+                break
+            reason = rejection(coords[last], coords[i], threshold)
+            if reason:
+                rejected.append((offset + i, reason))
+            else:
+                keep.append(i)
+                last = i
+        if last_c is not None:
+            keep = [i - 1 for i in keep]
+        if isinstance(original, CoordArray):
+            return original.take(keep)
+        return [original[i] for i in keep]
+
+    def extend(self, coords):
+        """Append coords, which follow the existing coordinates, and
+        re-analyse the track."""
+        offset = self.input_length
+        self.input_length += len(coords)
+        coords = Track.filter(coords, self.coords[-1], self.rejected, offset,
+                              self.distance_threshold)
+        if not coords:
+            return
+        n = len(self.coords)
+        self.coords.extend(coords)
+        self.trig.extend(coords)
+        self.t.extend(whole_times(coords))
+        for name in INDEXED + SIMPLIFIED:
+            self.__dict__.pop(name, None)
+        if self.analysed:
+            self.analyse(self.window, n, ())
+        elif self.measured:
+            self.measure()
+
+    def evaluate(self):
+        """Compute all the attributes that are computed on first use."""
+        self.require(SERIES)
+        if not self.classified:
+            self.classify(0)
+
+    def require(self, keys):
+        """Compute those of the SERIES in keys that have not been computed
+        yet, in one pass, over the current window."""
+        keys = [key for key in keys if key not in self.__dict__]
+        if keys or not self.analysed:
+            self.analyse(self.window if self.analysed else WINDOW, None, keys)
+
+    def coord_at(self, t):
+        """Return the coordinate at t seconds since the UTC epoch."""
+        return self.coords_at([t])[0]
+
+    def coords_at(self, times):
+        """Return the coordinates at each of times, in seconds since the UTC
+        epoch.
+
+        Sorted times are found with a single walk over the track, and the
+        coordinates between fixes are interpolated together.
+
+        """
+        result, indexes, deltas, positions = [], [], [], []
+        index = None
+        for t in times:
+            t = int(t)
+            if t < self.t[0]:
+                result.append(self.coords[0])
                 continue
-            ds = last_c.distance_to(c)
-            dt = (c.dt - last_c.dt).seconds
-            if dt == 0 or ds / dt > 100.0:
+            if self.t[-1] <= t:
+                result.append(self.coords[-1])
                 continue
-            dz = c.ele - last_c.ele
-            if dz / dt < -30.0 or 30.0 < dz / dt:
+            if index is None or self.t[index - 1] >= t:
+                index = bisect.bisect_left(self.t, t)
+            while self.t[index] < t:
+                index += 1
+            if self.t[index] == t:
+                result.append(self.coords[index])
                 continue
-            result.append(c)
-            last_c = c
+            indexes.append(index - 1)
+            deltas.append(float(t - self.t[index - 1])
+                          / (self.t[index] - self.t[index - 1]))
+            positions.append(len(result))
+            result.append(None)
+        if indexes:
+            lats, lons = self.trig.interpolate(indexes, deltas)
+            for i, lat, lon, index, delta in izip(positions, lats, lons,
+                                                  indexes, deltas):
+                ele = (1.0 - delta) * self.coords[index].ele \
+                      + delta * self.coords[index + 1].ele
+                result[i] = Coord(lat, lon, ele)
         return result
 
-    def coord_at(self, dt):
-        t = int(time.mktime(dt.timetuple()))
-        if t < self.t[0]:
-            return self.coords[0]
-        elif self.t[-1] <= t:
-            return self.coords[-1]
+    def elevations(self, start=0):
+        """Return the elevations of the coordinates from start onwards."""
+        if isinstance(self.coords, CoordArray):
+            return self.coords[start:].column('ele')
+        return [c.ele for c in self.coords[start:]]
+
+    def measure(self):
+        """Measure the cumulative distance and the altitudes of the
+        coordinates that have not been measured yet."""
+        n = len(self.coords)
+        start = self.measured
+        if start == 0:
+            self.s = [0.0]
+            self.ele = []
+            self.dz_positive, self.dz_negative = [0], [0]
+            self.total_dz_positive = self.max_dz_positive = 0
+            self.min_ele = self.coords[0].ele
+            self.elevation_data = self.coords[0].ele != 0
+            self.bounds = util.BoundsSet()
+            self.bounds.ele = util.Bounds(self.coords[0].ele)
+            if hasattr(self, 'tas'):
+                self.bounds.tas = util.Bounds(self.tas)
+            start = 1
+        ele = self.elevations(start - 1)
+        for ele1 in ele[1:]:
+            self.bounds.ele.update(ele1)
+        self.bounds.time = util.Bounds((self.coords[0].t, self.coords[-1].t))
+        self.bounds.t = util.Bounds((self.t[0], self.t[-1]))
+        if not self.elevation_data:
+            self.elevation_data = any(ele1 != 0 for ele1 in ele[1:])
+        s = self.s[-1]
+        for ds in self.trig.distances(start - 1, n,
+                                      self.distance_threshold).tolist():
+            s += ds
+            self.s.append(s)
+        self.ele.extend((ele0 + ele1) / 2.0
+                        for ele0, ele1 in izip(ele, ele[1:]))
+        dz_positive, dz_negative = self.dz_positive[-1], self.dz_negative[-1]
+        for ele0, ele1 in izip(ele, ele[1:]):
+            dz = ele1 - ele0
+            if dz > 0:
+                self.total_dz_positive += dz
+                dz_positive += dz
+            elif dz < 0:
+                dz_negative += dz
+            self.dz_positive.append(dz_positive)
+            self.dz_negative.append(dz_negative)
+            if ele1 < self.min_ele:
+                self.min_ele = ele1
+            elif ele1 - self.min_ele > self.max_dz_positive:
+                self.max_dz_positive = ele1 - self.min_ele
+        self.measured = n
+
+    def index(self):
+        """Index the climb and the vertical speed between consecutive
+        coordinates for range queries."""
+        self.climb_index = util.SparseTable(self.climb)
+        if numpy is not None and len(self.coords) >= NUMPY_THRESHOLD:
+            ele = numpy_column(self.coords, 'ele')
+            vs = (numpy.diff(ele) / numpy.diff(self.t)).tolist()
         else:
-            index = util.find_first_ge(self.t, t)
-            if self.t[index] == t:
-                return self.coords[index]
-            else:
-                delta = float(t - self.t[index - 1]) \
-                        / (self.t[index] - self.t[index - 1])
-                return self.coords[index - 1].interpolate(self.coords[index],
-                                                          delta)
+            ele = self.elevations()
+            vs = [float(ele1 - ele0) / (t1 - t0) for ele0, ele1, t0, t1
+                  in izip(ele, ele[1:], self.t, self.t[1:])]
+        self.vs_index = util.SparseTable(vs)
 
-    def analyse(self, dt):
+    def simplify(self):
+        """Compute the levels of detail of the track.
+
+        lod[0] is the index of every coordinate and lod[i] the sorted indexes
+        of the coordinates that the Visvalingam-Whyatt algorithm keeps with a
+        tolerance of LOD_TOLERANCES[i - 1] metres, that is those whose
+        effective areas on a local projection are greater than its square.
+        The levels are nested and share one ranking.
+
+        """
+        lat, lon = self.trig.lat, self.trig.lon
+        k = geodesy.R * cos((min(lat) + max(lat)) / 2.0)
+        x = [k * value for value in lon]
+        y = [geodesy.R * value for value in lat]
+        ranking = util.visvalingam_whyatt_ranking(x, y)
+        self.lod = [range(0, len(self.coords))]
+        for tolerance in LOD_TOLERANCES:
+            self.lod.append(util.visvalingam_whyatt(x, y,
+                                                    tolerance * tolerance,
+                                                    ranking=ranking))
+
+    def summarise(self, sl):
+        """Return the altitude gained and lost, the distance flown, and the
+        bounds of the climb and of the vertical speed between consecutive
+        coordinates over the segments in sl, in constant time."""
+        return util.OpenStruct(
+                dz_positive=self.dz_positive[sl.stop]
+                            - self.dz_positive[sl.start],
+                dz_negative=self.dz_negative[sl.stop]
+                            - self.dz_negative[sl.start],
+                distance=self.s[sl.stop] - self.s[sl.start],
+                climb=self.climb_index.bounds(sl.start, sl.stop),
+                vs=self.vs_index.bounds(sl.start, sl.stop))
+
+    def analyse(self, dt, start=1, keys=SERIES):
+        """Analyse the track over windows of dt seconds.
+
+        The SERIES in keys that have not been computed yet are computed in
+        full.  The ones that have are recomputed in full if start is one or
+        the windows have changed, not at all if start is None, and otherwise
+        only where the coordinates from start onwards can affect them.  The
+        classification is updated too if it has been computed.
+
+        """
         n = len(self.coords)
-        period = (self.coords[-1].dt - self.coords[0].dt).seconds / n
+        period = (self.t[-1] - self.t[0]) / n
         if dt < 2 * period:
             dt = 2 * period
-        self.bounds = util.BoundsSet()
-        self.bounds.ele = util.Bounds([coord.ele for coord in self.coords])
-        self.bounds.time = util.Bounds((self.coords[0].dt, self.coords[-1].dt))
-        self.bounds.t = util.Bounds((self.t[0], self.t[-1]))
-        if hasattr(self, 'tas'):
-            self.bounds.tas = util.Bounds(self.tas)
-        if self.bounds.ele.min != 0 or self.bounds.ele.max != 0:
-            self.elevation_data = True
+        windows = sorted(set(self.windows))
+        widths = [max(window, 2 * period) for window in windows]
+        self.measure()
+        computed = [key for key in SERIES if key in self.__dict__]
+        if start == 1 or not self.analysed or dt != self.window \
+           or widths != self.widths:
+            fresh = computed + [key for key in keys if key not in computed]
+            update = []
         else:
-            self.elevation_data = False
-        self.s = [0.0]
-        for i in xrange(1, n):
-            self.s.append(self.s[i - 1] +
-                          self.coords[i - 1].distance_to(self.coords[i]))
-        self.ele = [(self.coords[i - 1].ele + self.coords[i].ele) / 2.0
-                    for i in xrange(1, n)]
-        self.total_dz_positive = self.max_dz_positive = 0
-        min_ele = self.coords[0].ele
-        for i in xrange(1, n):
-            dz = self.coords[i].ele - self.coords[i - 1].ele
-            if dz > 0:
-                self.total_dz_positive += dz
-            if self.coords[i].ele < min_ele:
-                min_ele = self.coords[i].ele
-            elif self.coords[i].ele - min_ele > self.max_dz_positive:
-                self.max_dz_positive = self.coords[i].ele - min_ele
-        self.speed, self.climb, self.tec, self.progress = [], [], [], []
-        i0 = i1 = 0
-        for i in xrange(1, n):
-            t0 = (self.t[i - 1] + self.t[i]) / 2 - dt / 2
-            while self.t[i0] <= t0:
-                i0 += 1
-            if i0 == 0:
-                coord0 = self.coords[0]
-                s0 = self.s[0]
-            else:
-                delta0 = float(t0 - self.t[i0 - 1]) \
-                         / (self.t[i0] - self.t[i0 - 1])
-                coord0 = self.coords[i0 - 1].interpolate(self.coords[i0],
-                                                         delta0)
-                s0 = (1.0 - delta0) * self.s[i0 - 1] + delta0 * self.s[i0]
-            t1 = t0 + dt
-            while i1 < n and self.t[i1] < t1:
-                i1 += 1
-            if i1 == n:
-                coord1 = self.coords[n - 1]
-                s1 = self.s[n - 1]
-            else:
-                delta1 = float(t1 - self.t[i1 - 1]) \
-                         / (self.t[i1] - self.t[i1 - 1])
-                coord1 = self.coords[i1 - 1].interpolate(self.coords[i1],
-                                                         delta1)
-                s1 = (1.0 - delta1) * self.s[i1 - 1] + delta1 * self.s[i1]
-            ds = s1 - s0
-            ds2 = s1 * s1 - s0 * s0
-            dz = coord1.ele - coord0.ele
-            dp = coord0.distance_to(coord1)
-            if ds == 0.0:
-                progress = 0.0
-            elif dp > ds:
-                progress = 1.0
-            else:
-                progress = dp / ds
-            self.speed.append(3.6 * ds / dt)
-            self.climb.append(dz / dt)
-            self.tec.append(dz / dt + ds2 / (2 * 9.80665))
-            self.progress.append(progress)
-        self.bounds.speed = util.Bounds(self.speed)
-        self.bounds.climb = util.Bounds(self.climb)
-        self.bounds.tec = util.Bounds(self.tec)
-        state = [UNKNOWN] * (n - 1)
-        glide = (self.progress[i] >= 0.9 for i in xrange(0, n - 1))
-        for sl in util.condense(util.runs_where(glide), self.t, 60):
-            state[sl] = [GLIDE] * (sl.stop - sl.start)
-        dive = (self.progress[i] < 0.9 and self.climb[i] < 1.0
-                for i in xrange(0, n - 1))
-        for sl in util.condense(util.runs_where(dive), self.t, 30):
-            if self.coords[sl.stop].ele - self.coords[sl.start].ele < -100:
-                state[sl] = [DIVE] * (sl.stop - sl.start)
-        thermal = ((self.progress[i] < 0.9 and self.climb[i] > 0.0)
-                   or (self.speed[i] < 10.0 and self.climb[i] > 0.0)
-                   or (self.climb[i] > 1.0)
-                   for i in xrange(0, n - 1))
-        for sl in util.condense(util.runs_where(thermal), self.t, 60):
-            state[sl] = [THERMAL] * (sl.stop - sl.start)
-        self.thermals, self.glides, self.dives = [], [], []
-        for sl in util.runs(state):
+            fresh = [key for key in keys if key not in computed]
+            update = [] if start is None else computed
+        self.window = dt
+        self.widths = widths
+        # Windows that ran past the old last coordinate were truncated there,
+        # so recompute every value from the first such window onwards
+        jobs = []
+        first = n
+        update_keys = [key for key in update if key in WINDOWED]
+        if update_keys:
+            first = self.first_window(dt, start)
+            jobs.append((dt, first, self, update_keys))
+        fresh_keys = [key for key in fresh if key in WINDOWED]
+        if fresh_keys:
+            for key in fresh_keys:
+                setattr(self, key, [])
+            jobs.append((dt, 1, self, fresh_keys))
+        if 'series' in update:
+            for window, width in zip(windows, widths):
+                jobs.append((width, self.first_window(width, start),
+                             self.series[window], WINDOWED))
+        if 'series' in fresh:
+            self.series = {}
+            for window, width in zip(windows, widths):
+                self.series[window] = util.OpenStruct(window=width, speed=[],
+                                                      climb=[], tec=[],
+                                                      progress=[])
+                jobs.append((width, 1, self.series[window], WINDOWED))
+        stale = {}
+        for key in ('speed', 'climb', 'tec'):
+            if key in update_keys:
+                values = getattr(self, key)
+                bounds = getattr(self.bounds, key)
+                stale[key] = any(value == bounds.min or value == bounds.max
+                                 for value in values[first - 1:])
+        for width, job_first, target, job_keys in jobs:
+            for key in job_keys:
+                del getattr(target, key)[job_first - 1:]
+        if numpy is not None \
+           and sum(n - job[1] for job in jobs) >= NUMPY_THRESHOLD:
+            self.analyse_windows_numpy(jobs)
+        elif jobs:
+            self.analyse_windows(jobs)
+        for key in ('speed', 'climb', 'tec'):
+            if key in fresh_keys or stale.get(key):
+                setattr(self.bounds, key, util.Bounds(getattr(self, key)))
+            elif key in update_keys:
+                bounds = getattr(self.bounds, key)
+                values = getattr(self, key)
+                for i in xrange(first - 1, n - 1):
+                    bounds.update(values[i])
+        self.analysed = n
+        if self.classified:
+            if set(fresh_keys) & set(('speed', 'climb', 'progress')):
+                first = 1
+            if first < n:
+                self.classify(first - 1)
+
+    def first_window(self, dt, start):
+        """Return the index of the first window of length dt that reaches
+        past the coordinate before start."""
+        first = start
+        while first > 1 and (self.t[first - 2] + self.t[first - 1]) / 2 \
+                            - dt / 2 + dt > self.t[start - 1]:
+            first -= 1
+        return first
+
+    def windows_offset(self, jobs):
+        """Return the index of the first coordinate that the windows of
+        jobs, as analyse_windows, can reach."""
+        offset = len(self.coords)
+        for dt, first, target, keys in jobs:
+            t0 = (self.t[first - 1] + self.t[first]) / 2 - dt / 2
+            offset = min(offset, max(bisect.bisect_right(self.t, t0) - 1, 0))
+        return offset
+
+    def analyse_windows(self, jobs):
+        """Append the series in keys over windows of length dt around each
+        segment from first onwards to target, for each (dt, first, target,
+        keys) in jobs, in one pass over the track.
+
+        Only progress needs the positions at the ends of the windows, so they
+        are only interpolated for the jobs that compute it.
+
+        """
+        n = len(self.coords)
+        # Make the Coords that the windows can reach once, not at every step
+        offset = self.windows_offset(jobs)
+        ele = [None] * offset + list(self.elevations(offset))
+        if any('progress' in keys for dt, first, target, keys in jobs):
+            coords = [None] * offset + list(self.coords[offset:])
+        states = []
+        for dt, first, target, keys in jobs:
+            states.append([None, None]
+                          + [getattr(target, key) if key in keys else None
+                             for key in WINDOWED])
+        for i in xrange(min(job[1] for job in jobs), n):
+            for (dt, first, target, keys), state in izip(jobs, states):
+                if i < first:
+                    continue
+                i0, i1, speed, climb, tec, progress = state
+                t0 = (self.t[i - 1] + self.t[i]) / 2 - dt / 2
+                if i0 is None:
+                    i0 = bisect.bisect_right(self.t, t0)
+                while self.t[i0] <= t0:
+                    i0 += 1
+                if i0 == 0:
+                    s0, ele0 = self.s[0], ele[0]
+                    if progress is not None:
+                        coord0 = coords[0]
+                else:
+                    delta0 = float(t0 - self.t[i0 - 1]) \
+                             / (self.t[i0] - self.t[i0 - 1])
+                    s0 = (1.0 - delta0) * self.s[i0 - 1] + delta0 * self.s[i0]
+                    ele0 = (1.0 - delta0) * ele[i0 - 1] + delta0 * ele[i0]
+                    if progress is not None:
+                        coord0 = coords[i0 - 1].interpolate(coords[i0],
+                                                            delta0)
+                t1 = t0 + dt
+                if i1 is None:
+                    i1 = bisect.bisect_left(self.t, t1)
+                while i1 < n and self.t[i1] < t1:
+                    i1 += 1
+                if i1 == n:
+                    s1, ele1 = self.s[n - 1], ele[n - 1]
+                    if progress is not None:
+                        coord1 = coords[n - 1]
+                else:
+                    delta1 = float(t1 - self.t[i1 - 1]) \
+                             / (self.t[i1] - self.t[i1 - 1])
+                    s1 = (1.0 - delta1) * self.s[i1 - 1] + delta1 * self.s[i1]
+                    ele1 = (1.0 - delta1) * ele[i1 - 1] + delta1 * ele[i1]
+                    if progress is not None:
+                        coord1 = coords[i1 - 1].interpolate(coords[i1],
+                                                            delta1)
+                state[0], state[1] = i0, i1
+                ds = s1 - s0
+                dz = ele1 - ele0
+                if speed is not None:
+                    speed.append(3.6 * ds / dt)
+                if climb is not None:
+                    climb.append(dz / dt)
+                if tec is not None:
+                    tec.append(dz / dt + (s1 * s1 - s0 * s0) / (2 * 9.80665))
+                if progress is not None:
+                    dp = coord0.distance_to(coord1, self.distance_threshold)
+                    if ds == 0.0:
+                        progress.append(0.0)
+                    elif dp > ds:
+                        progress.append(1.0)
+                    else:
+                        progress.append(dp / ds)
+
+    def analyse_windows_numpy(self, jobs):
+        """Compute the same values as analyse_windows with array operations,
+        with the windows of every job in the same arrays."""
+        n = len(self.coords)
+        offset = self.windows_offset(jobs)
+        m = n - offset
+        coords = self.coords[offset:]
+        t = numpy.array(self.t[offset:])
+        s = numpy.array(self.s[offset:])
+        ele = numpy_column(coords, 'ele')
+        lengths = [n - first for dt, first, target, keys in jobs]
+        i = numpy.concatenate([numpy.arange(first - offset, m)
+                               for dt, first, target, keys in jobs])
+        dt = numpy.repeat([dt for dt, first, target, keys in jobs], lengths)
+        t0 = (t[i - 1] + t[i]) // 2 - dt / 2
+        t1 = t0 + dt
+        i0 = numpy.searchsorted(t, t0, 'right')
+        i1 = numpy.searchsorted(t, t1, 'left')
+        at_start, at_end = i0 == 0, i1 == m
+        if (at_start & at_end).any():
+            # The window covers the whole track, where analyse_windows mixes
+            # integer arithmetic into the result
+            return self.analyse_windows(jobs)
+        i0 = numpy.maximum(i0, 1)
+        i1 = numpy.minimum(i1, m - 1)
+        delta0 = (t0 - t[i0 - 1]).astype(float) / (t[i0] - t[i0 - 1])
+        ele0 = (1.0 - delta0) * ele[i0 - 1] + delta0 * ele[i0]
+        s0 = (1.0 - delta0) * s[i0 - 1] + delta0 * s[i0]
+        if at_start.any():
+            ele0[at_start], s0[at_start] = ele[0], s[0]
+        delta1 = (t1 - t[i1 - 1]).astype(float) / (t[i1] - t[i1 - 1])
+        ele1 = (1.0 - delta1) * ele[i1 - 1] + delta1 * ele[i1]
+        s1 = (1.0 - delta1) * s[i1 - 1] + delta1 * s[i1]
+        if at_end.any():
+            ele1[at_end], s1[at_end] = ele[-1], s[-1]
+        ds = s1 - s0
+        dz = ele1 - ele0
+        values = {'speed': 3.6 * ds / dt,
+                  'climb': dz / dt,
+                  'tec': dz / dt + (s1 * s1 - s0 * s0) / (2 * 9.80665)}
+        # Only interpolate the positions for the windows of jobs that compute
+        # progress
+        rows = numpy.flatnonzero(numpy.repeat(['progress' in job[3]
+                                               for job in jobs], lengths))
+        if len(rows):
+            lat0, lon0 = self.trig.interpolate(offset + i0[rows] - 1,
+                                               delta0[rows])
+            rows_at_start = at_start[rows]
+            if rows_at_start.any():
+                lat0[rows_at_start] = self.trig.lat[0]
+                lon0[rows_at_start] = self.trig.lon[0]
+            lat1, lon1 = self.trig.interpolate(offset + i1[rows] - 1,
+                                               delta1[rows])
+            rows_at_end = at_end[rows]
+            if rows_at_end.any():
+                lat1[rows_at_end] = self.trig.lat[-1]
+                lon1[rows_at_end] = self.trig.lon[-1]
+            dp = geodesy.distances(lat0, lon0, numpy.cos(lat0),
+                                   lat1, lon1, numpy.cos(lat1),
+                                   self.distance_threshold)
+            progress = numpy.zeros(len(i))
+            with numpy.errstate(divide='ignore', invalid='ignore'):
+                progress[rows] = numpy.where(ds[rows] == 0.0, 0.0,
+                                             numpy.where(dp > ds[rows], 1.0,
+                                                         dp / ds[rows]))
+            values['progress'] = progress
+        stop = 0
+        for (dt, first, target, keys), length in zip(jobs, lengths):
+            start, stop = stop, stop + length
+            for key in keys:
+                getattr(target, key).extend(values[key][start:stop].tolist())
+
+    def update_runs(self, state, delta, start):
+        """Discard the condensed runs of state that may be changed by the
+        values from index start onwards, and return the index from which
+        they must be recomputed."""
+        runs = self.runs[state]
+        while runs and (runs[-1].stop >= start
+                        or self.t[start] - self.t[runs[-1].stop] < delta):
+            start = min(start, runs.pop().start)
+        return start
+
+    def classify(self, start):
+        """Classify the track into thermals, glides and dives, assuming that
+        only the analysis from index start onwards has changed."""
+        n = len(self.coords)
+        self.require(('speed', 'climb', 'progress'))
+        if not self.classified:
+            start = 0
+            self.state = []
+            self.runs = {GLIDE: [], DIVE: [], THERMAL: []}
+            self.thermals, self.glides, self.dives = [], [], []
+            self.classified = True
+        deltas = ((GLIDE, 60), (DIVE, 30), (THERMAL, 60))
+        starts = dict((value, self.update_runs(value, delta, start))
+                      for value, delta in deltas)
+        start = min(starts.values())
+        vectorised = numpy is not None and n - start >= NUMPY_THRESHOLD
+        if vectorised:
+            progress, climb, speed = [numpy.fromiter(series[start:], float,
+                                                     n - 1 - start)
+                                      for series in (self.progress,
+                                                     self.climb, self.speed)]
+            masks = {GLIDE: progress >= 0.9,
+                     DIVE: (progress < 0.9) & (climb < 1.0),
+                     THERMAL: ((progress < 0.9) | (speed < 10.0))
+                              & (climb > 0.0) | (climb > 1.0)}
+            state = numpy.empty(n - 1 - start, dtype=int)
+            state.fill(UNKNOWN)
+        else:
+            progress = self.progress[start:]
+            climb = self.climb[start:]
+            speed = self.speed[start:]
+            masks = {GLIDE: [p >= 0.9 for p in progress],
+                     DIVE: [p < 0.9 and c < 1.0
+                            for p, c in izip(progress, climb)],
+                     THERMAL: [(p < 0.9 or s < 10.0) and c > 0.0 or c > 1.0
+                               for p, c, s in izip(progress, climb, speed)]}
+            state = [UNKNOWN] * (n - 1 - start)
+        for value, delta in deltas:
+            first = starts[value]
+            mask = masks[value][first - start:]
+            run_starts, run_stops = util.mask_runs(mask, first)
+            run_starts, run_stops = util.condense_runs(run_starts, run_stops,
+                                                       self.t, delta)
+            self.runs[value].extend(slice(run_start, run_stop)
+                                    for run_start, run_stop
+                                    in izip(run_starts, run_stops))
+        for value in (GLIDE, DIVE, THERMAL):
+            for sl in reversed(self.runs[value]):
+                if sl.stop <= start:
+                    break
+                if value == DIVE and self.coords[sl.stop].ele \
+                                     - self.coords[sl.start].ele >= -100:
+                    continue
+                sl = slice(max(sl.start, start) - start, sl.stop - start)
+                if vectorised:
+                    state[sl] = value
+                else:
+                    state[sl] = [value] * (sl.stop - sl.start)
+        del self.state[start:]
+        self.state.extend(state.tolist() if vectorised else state)
+        state = self.state
+        # Segments that begin before the run containing start are unchanged
+        if start > 0:
+            start -= 1
+            while start > 0 and state[start - 1] == state[start]:
+                start -= 1
+        for segments in (self.thermals, self.glides, self.dives):
+            while segments and segments[-1].start >= start:
+                segments.pop()
+        for sl in map(slice, *util.run_edges(state[start:], start)):
             dt = self.t[sl.stop] - self.t[sl.start]
             dz = self.coords[sl.stop].ele - self.coords[sl.start].ele
             if state[sl.start] == THERMAL:
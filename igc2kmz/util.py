@@ -16,10 +16,20 @@
 
 
 import __builtin__
-import datetime
+import bz2
+import gzip
+import heapq
 import itertools
 import math
+import os.path
 import sys
+import time
+import zipfile
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 
 class Bounds(object):
@@ -68,6 +78,55 @@ class BoundsSet(object):
                 setattr(self, key, Bounds(value.tuple()))
 
 
+class SparseTable(object):
+    """The Bounds of any range of values in constant time.
+
+    The values are split into blocks of block values, and the minima and
+    maxima of every power of two length range of blocks are stored, so a
+    query looks up two overlapping ranges of whole blocks and scans at most
+    two partial blocks.
+
+    """
+
+    def __init__(self, values, block=16):
+        self.values = list(values)
+        self.block = block
+        starts = xrange(0, len(self.values) - block + 1, block)
+        mins = [min(self.values[i:i + block]) for i in starts]
+        maxs = [max(self.values[i:i + block]) for i in starts]
+        self.mins, self.maxs = [mins], [maxs]
+        half = 1
+        while 2 * half <= len(self.mins[0]):
+            mins = map(min, mins[:-half], mins[half:])
+            maxs = map(max, maxs[:-half], maxs[half:])
+            self.mins.append(mins)
+            self.maxs.append(maxs)
+            half *= 2
+
+    def __len__(self):
+        return len(self.values)
+
+    def bounds(self, start, stop):
+        """Return the Bounds of values[start:stop], which must not be
+        empty."""
+        block = self.block
+        first, last = -(-start // block), stop // block
+        if first >= last:
+            values = self.values[start:stop]
+            return Bounds((min(values), max(values)))
+        k = (last - first).bit_length() - 1
+        mins, maxs = self.mins[k], self.maxs[k]
+        i = last - (1 << k)
+        lower = min(mins[first], mins[i])
+        upper = max(maxs[first], maxs[i])
+        for values in (self.values[start:first * block],
+                       self.values[last * block:stop]):
+            if values:
+                lower = min(lower, min(values))
+                upper = max(upper, max(values))
+        return Bounds((lower, upper))
+
+
 class OpenStruct(object):
 
     def __init__(self, **kwargs):
@@ -81,13 +140,13 @@ class OpenStruct(object):
                                             for key, value in self)
 
 
-def runs(seq):
-    generator = enumerate(seq)
+def runs(seq, offset=0):
+    generator = enumerate(seq, offset)
     try:
         start, current = generator.next()
     except StopIteration:
         return
-    index = 0
+    index = start
     for index, element in generator:
         if element != current:
             yield slice(start, index)
@@ -95,13 +154,13 @@ def runs(seq):
     yield slice(start, index + 1)
 
 
-def runs_where(seq):
-    generator = enumerate(seq)
+def runs_where(seq, offset=0):
+    generator = enumerate(seq, offset)
     try:
         start, current = generator.next()
     except StopIteration:
         return
-    index = 0
+    index = start
     for index, element in generator:
         if element != current:
             if current:
@@ -126,27 +185,213 @@ def condense(seq, t, delta):
     yield slice(start, stop)
 
 
-def douglas_peucker(x, y, epsilon):
+def run_edges(seq, offset=0):
+    """Return the starts and stops of the runs of equal values in seq, plus
+    offset, as two lists."""
+    n = len(seq)
+    if n == 0:
+        return ([], [])
+    if numpy is not None:
+        values = numpy.asarray(seq)
+        edges = (numpy.flatnonzero(values[1:] != values[:-1])
+                 + (offset + 1)).tolist()
+    else:
+        edges = [offset + i for i in xrange(1, n) if seq[i] != seq[i - 1]]
+    return ([offset] + edges, edges + [offset + n])
+
+
+def mask_runs(mask, offset=0):
+    """Return the starts and stops of the runs of true values in mask, plus
+    offset, as two lists."""
+    if numpy is not None:
+        edges = numpy.concatenate(([0], numpy.asarray(mask, dtype=numpy.int8),
+                                   [0]))
+        edges = (numpy.flatnonzero(numpy.diff(edges)) + offset).tolist()
+        return (edges[0::2], edges[1::2])
+    starts, stops = [], []
+    for sl in runs_where(mask, offset):
+        starts.append(sl.start)
+        stops.append(sl.stop)
+    return (starts, stops)
+
+
+def condense_runs(starts, stops, t, delta):
+    """Return the starts and stops of runs, as condense, merging the runs
+    that are separated by less than delta in t."""
+    if not starts:
+        return ([], [])
+    keep = [t[start] - t[stop] >= delta
+            for start, stop in itertools.izip(starts[1:], stops[:-1])]
+    return ([starts[0]] + list(itertools.compress(starts[1:], keep)),
+            list(itertools.compress(stops[:-1], keep)) + [stops[-1]])
+
+
+class HullTree(object):
+    """The upper and lower convex hulls of the nodes of a segment tree over
+    blocks of consecutive points.
+
+    A range of points is covered by O(log n) nodes, and the points of each
+    node that are farthest from a line on either side are found by binary
+    search on its hulls, so the point in a range that is farthest from a line
+    is found in O(log**2 n) time.  Collinear points are kept on the hulls,
+    and only the first of coincident points, so that ties can be broken by
+    index.
+
     """
-    Implement the Douglas-Peucker line simplification algorithm.
-    TODO: implement http://www.cs.ubc.ca/cgi-bin/tr/1992/TR-92-07.ps
+
+    def __init__(self, x, y, block=16):
+        self.x, self.y, self.block = x, y, block
+        n = len(x)
+        order = sorted(xrange(0, n), key=lambda i: (x[i], y[i]))
+        rank = [0] * n
+        for r, i in enumerate(order):
+            rank[i] = r
+        self.m = m = (n + block - 1) // block
+        upper, lower = [[]] * (2 * m), [[]] * (2 * m)
+        for b in xrange(0, m):
+            ranks = sorted(rank[b * block:(b + 1) * block])
+            upper[m + b] = self.chain(order, ranks, 1)
+            lower[m + b] = self.chain(order, ranks, -1)
+        # The hull of the union of two nodes is the hull of their hulls
+        for i in xrange(m - 1, 0, -1):
+            upper[i] = self.chain(order, sorted(upper[2 * i]
+                                                + upper[2 * i + 1]), 1)
+            lower[i] = self.chain(order, sorted(lower[2 * i]
+                                                + lower[2 * i + 1]), -1)
+        self.upper = [[order[r] for r in ranks] for ranks in upper]
+        self.lower = [[order[r] for r in ranks] for ranks in lower]
+
+    def chain(self, order, ranks, sign):
+        """Return the ranks of the upper (sign 1) or lower (sign -1) hull of
+        the points with the sorted ranks."""
+        x, y = self.x, self.y
+        result = []
+        for r in ranks:
+            i = order[r]
+            if result and x[i] == x[order[result[-1]]] \
+               and y[i] == y[order[result[-1]]]:
+                continue
+            while len(result) >= 2:
+                j, k = order[result[-2]], order[result[-1]]
+                if sign * ((x[k] - x[j]) * (y[i] - y[j])
+                           - (y[k] - y[j]) * (x[i] - x[j])) > 0:
+                    result.pop()
+                else:
+                    break
+            result.append(r)
+        return result
+
+    def extremes(self, chain, kx, ky):
+        """Return the points of chain, at least one of which maximizes
+        kx * x + ky * y, including all of those that do."""
+        x, y = self.x, self.y
+        lo, hi = 0, len(chain) - 1
+        while lo < hi:
+            mid = (lo + hi) // 2
+            i, j = chain[mid], chain[mid + 1]
+            if kx * (x[j] - x[i]) + ky * (y[j] - y[i]) > 0:
+                lo = mid + 1
+            else:
+                hi = mid
+        hi = lo + 1
+        while hi < len(chain) and kx * (x[chain[hi]] - x[chain[hi - 1]]) \
+                                  + ky * (y[chain[hi]] - y[chain[hi - 1]]) == 0:
+            hi += 1
+        return chain[max(lo - 1, 0):hi + 1]
+
+    def candidates(self, lo, hi, kx, ky):
+        """Return the points from lo to hi, inclusive, at least one of which
+        is farthest from any line with normal (kx, ky), including all of
+        those that are.  ky must not be zero."""
+        block = self.block
+        first, last = lo // block + 1, hi // block
+        result = range(lo, min(first * block, hi + 1))
+        result.extend(xrange(max(last * block, first * block), hi + 1))
+        # kx * x + ky * y is greatest on the upper hull if ky is positive
+        if ky > 0:
+            greatest, least = self.upper, self.lower
+        else:
+            greatest, least = self.lower, self.upper
+        nodes = []
+        l, h = first + self.m, last + self.m
+        while l < h:
+            if l & 1:
+                nodes.append(l)
+                l += 1
+            if h & 1:
+                h -= 1
+                nodes.append(h)
+            l >>= 1
+            h >>= 1
+        for node in nodes:
+            result.extend(self.extremes(greatest[node], kx, ky))
+            result.extend(self.extremes(least[node], -kx, -ky))
+        return result
+
+
+class FarthestPoints(object):
+    """Find the point between two others that is farthest from the line
+    through them.
+
+    Spans are scanned until the number of points scanned exceeds
+    2 n log2 s, where s is the number of spans, which only happens when the
+    spans are split unevenly, as those of spirals are.  The points are then
+    found with a HullTree, if there are at least min_tree_length of them.
+
     """
-    indexes = set([0])
-    stack = [(0, len(x) - 1)]
-    while stack:
-        left, right = stack.pop()
-        indexes.add(right)
+
+    # Below this many points building a HullTree costs more than it saves
+    min_tree_length = 10000
+
+    def __init__(self, x, y):
+        self.x, self.y = x, y
+        self.scanned = self.spans = 0
+        self.tree = None
+
+    def find(self, left, right):
+        """Return the index of the first point strictly between left and
+        right that is farthest from the line through them, and its
+        distance."""
+        x, y = self.x, self.y
         kx, ky = y[left] - y[right], x[right] - x[left]
         c = x[left] * y[right] - x[right] * y[left]
         pivot = left + 1
         max_dist = abs(kx * x[pivot] + ky * y[pivot] + c)
-        for i in xrange(left + 2, right):
-            dist = abs(kx * x[i] + ky * y[i] + c)
-            if dist > max_dist:
-                max_dist = dist
-                pivot = i
+        if self.tree is None and len(x) >= self.min_tree_length:
+            self.scanned += right - left
+            self.spans += 1
+            if self.scanned > 2 * len(x) * math.log(self.spans + 1, 2):
+                self.tree = HullTree(x, y)
+        if self.tree is None or right - left < 4 * self.tree.block \
+           or ky == 0:
+            for i in xrange(left + 2, right):
+                dist = abs(kx * x[i] + ky * y[i] + c)
+                if dist > max_dist:
+                    max_dist = dist
+                    pivot = i
+        else:
+            for i in self.tree.candidates(left + 2, right - 1, kx, ky):
+                dist = abs(kx * x[i] + ky * y[i] + c)
+                if dist > max_dist or dist == max_dist and i < pivot:
+                    max_dist = dist
+                    pivot = i
         max_dist /= math.sqrt((x[right] - x[left]) ** 2
                               + (y[right] - y[left]) ** 2)
+        return (pivot, max_dist)
+
+
+def douglas_peucker(x, y, epsilon):
+    """
+    Implement the Douglas-Peucker line simplification algorithm, in
+    O(n log**2 n) time in the worst case.
+    """
+    farthest = FarthestPoints(x, y)
+    indexes = set([0])
+    stack = [(0, len(x) - 1)]
+    while stack:
+        left, right = stack.pop()
+        indexes.add(right)
+        pivot, max_dist = farthest.find(left, right)
         if max_dist > epsilon:
             indexes.add(pivot)
             stack.append((left, pivot))
@@ -155,6 +400,7 @@ def douglas_peucker(x, y, epsilon):
 
 
 def incr_douglas_peucker(x, y, epsilon, max_indexes=sys.maxint):
+    farthest = FarthestPoints(x, y)
     indexes = set([0])
     queue = [(0, len(x) - 1)]
     i = 0
@@ -164,17 +410,7 @@ def incr_douglas_peucker(x, y, epsilon, max_indexes=sys.maxint):
         indexes.add(right)
         if len(indexes) == max_indexes:
             break
-        kx, ky = y[left] - y[right], x[right] - x[left]
-        c = x[left] * y[right] - x[right] * y[left]
-        pivot = left + 1
-        max_dist = abs(kx * x[pivot] + ky * y[pivot] + c)
-        for j in xrange(left + 2, right):
-            dist = abs(kx * x[j] + ky * y[j] + c)
-            if dist > max_dist:
-                max_dist = dist
-                pivot = j
-        max_dist /= math.sqrt((x[right] - x[left]) ** 2
-                              + (y[right] - y[left]) ** 2)
+        pivot, max_dist = farthest.find(left, right)
         if max_dist > epsilon:
             indexes.add(pivot)
             if len(indexes) == max_indexes:
@@ -184,6 +420,69 @@ def incr_douglas_peucker(x, y, epsilon, max_indexes=sys.maxint):
     return sorted(indexes)
 
 
+def visvalingam_whyatt_ranking(x, y):
+    """Return the indexes of the points of a line from the most important to
+    the least, with their effective areas, in O(n log n) time.
+
+    The Visvalingam-Whyatt algorithm repeatedly removes the point that forms
+    the triangle of least area with its remaining neighbours, the first such
+    point if there are several.  The effective area of a point is the area of
+    its triangle when it is removed, but no less than that of any point
+    removed before it, so the effective areas do not increase along the
+    ranking.  The ends of the line come first, with infinite areas.
+
+    """
+    n = len(x)
+    if n <= 2:
+        return [(i, float('inf')) for i in xrange(0, n)]
+    ranking = [(0, float('inf')), (n - 1, float('inf'))]
+    prev, next = range(-1, n - 1), range(1, n + 1)
+
+    def area(i):
+        j, k = prev[i], next[i]
+        return abs((x[j] - x[i]) * (y[k] - y[i])
+                   - (x[k] - x[i]) * (y[j] - y[i])) / 2.0
+
+    areas = [None] + [area(i) for i in xrange(1, n - 1)] + [None]
+    heap = [(areas[i], i) for i in xrange(1, n - 1)]
+    heapq.heapify(heap)
+    removed = []
+    max_area = 0.0
+    while heap:
+        value, i = heapq.heappop(heap)
+        if value != areas[i]:
+            continue
+        areas[i] = None
+        max_area = max(max_area, value)
+        removed.append((i, max_area))
+        j, k = prev[i], next[i]
+        next[j], prev[k] = k, j
+        for neighbour in (j, k):
+            if 0 < neighbour < n - 1:
+                areas[neighbour] = area(neighbour)
+                heapq.heappush(heap, (areas[neighbour], neighbour))
+    ranking.extend(reversed(removed))
+    return ranking
+
+
+def visvalingam_whyatt(x, y, epsilon, max_indexes=sys.maxint, ranking=None):
+    """Return the sorted indexes of the at most max_indexes most important
+    points of a line whose effective areas are greater than epsilon.
+
+    ranking, if given, must be the result of visvalingam_whyatt_ranking(x, y),
+    so that several simplifications can share it.
+
+    """
+    if ranking is None:
+        ranking = visvalingam_whyatt_ranking(x, y)
+    indexes = []
+    for index, area in ranking:
+        if len(indexes) == max_indexes or area <= epsilon:
+            break
+        indexes.append(index)
+    return sorted(indexes)
+
+
 def bsearch(seq, value, cmp=__builtin__.cmp):
     left, right = 0, len(seq)
     while left <= right:
@@ -222,65 +521,181 @@ def pairwise(iterable):
     return itertools.izip(a, b)
 
 
-def salient(seq, epsilon=0):
-    def helper(start, stop):
+def turning_points(seq):
+    """Return the indexes of seq that are not inside strictly monotonic runs
+    and do not repeat the previous value.
+
+    Only these indexes can be the start or the end of the largest rise or fall
+    in any range of seq whose ends are among them, and the first such rise or
+    fall is the same if the other indexes are skipped.
+
+    """
+    n = len(seq)
+    result = [0] if n else []
+    for i in xrange(1, n - 1):
+        if seq[i] == seq[i - 1]:
+            continue
+        if seq[i - 1] < seq[i] < seq[i + 1] or seq[i - 1] > seq[i] > seq[i + 1]:
+            continue
+        result.append(i)
+    if n > 1:
+        result.append(n - 1)
+    return result
+
+
+class SwingTree(object):
+    """A segment tree of the largest fall and the largest rise within the
+    ranges of a sequence of values.
+
+    Each node stores the first index of its maximum and of its minimum, and
+    its largest fall and rise (delta, i, j), where j is the first index at
+    which the largest value is reached and i is the first index of the
+    maximum, or minimum, of the values up to j, as a scan finds them.
+
+    """
+
+    def __init__(self, values):
+        self.values = values
+        size = 1
+        while size < len(values):
+            size *= 2
+        self.size = size
+        nodes = [None] * (2 * size)
+        for i in xrange(0, len(values)):
+            nodes[size + i] = (i, i, 0, None, None, 0, None, None)
+        for i in xrange(size - 1, 0, -1):
+            nodes[i] = self.merge(nodes[2 * i], nodes[2 * i + 1])
+        self.nodes = nodes
+
+    def merge(self, a, b):
+        """Return the node of the range a followed by the range b."""
+        if a is None:
+            return b
+        if b is None:
+            return a
+        v = self.values
+        a_max, a_min, a_fall, a_fall_i, a_fall_j, a_rise, a_rise_i, a_rise_j \
+                = a
+        b_max, b_min, b_fall, b_fall_i, b_fall_j, b_rise, b_rise_i, b_rise_j \
+                = b
+        fall = max(a_fall, b_fall, v[a_max] - v[b_min])
+        if fall <= 0:
+            fall, fall_i, fall_j = 0, None, None
+        elif a_fall == fall:
+            fall_i, fall_j = a_fall_i, a_fall_j
+        elif b_fall == fall and (v[a_max] - v[b_min] != fall
+                                 or b_fall_j <= b_min):
+            fall_j = b_fall_j
+            fall_i = a_max if v[a_max] >= v[b_fall_i] else b_fall_i
+        else:
+            fall_i, fall_j = a_max, b_min
+        rise = max(a_rise, b_rise, v[b_max] - v[a_min])
+        if rise <= 0:
+            rise, rise_i, rise_j = 0, None, None
+        elif a_rise == rise:
+            rise_i, rise_j = a_rise_i, a_rise_j
+        elif b_rise == rise and (v[b_max] - v[a_min] != rise
+                                 or b_rise_j <= b_max):
+            rise_j = b_rise_j
+            rise_i = a_min if v[a_min] <= v[b_rise_i] else b_rise_i
+        else:
+            rise_i, rise_j = a_min, b_max
+        return (a_max if v[a_max] >= v[b_max] else b_max,
+                a_min if v[a_min] <= v[b_min] else b_min,
+                fall, fall_i, fall_j, rise, rise_i, rise_j)
+
+    def query(self, start, stop):
+        """Return the node of the values from start to stop, inclusive."""
+        nodes = self.nodes
+        left = right = None
+        l, h = start + self.size, stop + self.size + 1
+        while l < h:
+            if l & 1:
+                left = self.merge(left, nodes[l])
+                l += 1
+            if h & 1:
+                h -= 1
+                right = self.merge(nodes[h], right)
+            l >>= 1
+            h >>= 1
+        return self.merge(left, right)
+
+
+def salient_spans(seq, epsilon):
+    """Generate the salient spans of seq in depth first order.
+
+    Each span (left, right, delta) is the first largest fall within a range
+    whose ends do not rise, or the first largest rise within a range whose
+    ends do not fall, of at least epsilon.  The ranges between the ends of
+    the range and of the span are then searched in turn.  Ranges are scanned
+    until the number of values scanned exceeds 2 n log2 r, where r is the
+    number of ranges, as it does when each span splits off little of its
+    range, after which they are looked up in a SwingTree.
+
+    """
+    indexes = turning_points(seq)
+    values = [seq[i] for i in indexes]
+    stack = [(0, len(indexes) - 1)] if len(indexes) > 1 else []
+    tree = None
+    scanned = ranges = 0
+    while stack:
+        start, stop = stack.pop()
         if stop - start < 2:
-            return
+            continue
         delta = 0
         left, right = start, stop
-        if seq[start] <= seq[stop]:
-            max_index = start
-            for i in xrange(start + 1, stop + 1):
-                if seq[i] > seq[max_index]:
-                    max_index = i
-                elif seq[max_index] - seq[i] > delta:
-                    left, right = max_index, i
-                    delta = seq[max_index] - seq[i]
-        if seq[start] >= seq[stop]:
-            min_index = start
-            for i in xrange(start + 1, stop + 1):
-                if seq[i] < seq[min_index]:
-                    min_index = i
-                elif seq[i] - seq[min_index] > delta:
-                    left, right = min_index, i
-                    delta = seq[i] - seq[min_index]
+        if tree is None:
+            scanned += stop - start
+            ranges += 1
+            if scanned > 2 * len(values) * math.log(ranges + 1, 2):
+                tree = SwingTree(values)
+        if tree is not None:
+            node = tree.query(start, stop)
+            if values[start] <= values[stop] and node[2] > 0:
+                delta, left, right = node[2:5]
+            if values[start] >= values[stop] and node[5] > delta:
+                delta, left, right = node[5:8]
+        else:
+            if values[start] <= values[stop]:
+                max_index = start
+                for i in xrange(start + 1, stop + 1):
+                    if values[i] > values[max_index]:
+                        max_index = i
+                    elif values[max_index] - values[i] > delta:
+                        left, right = max_index, i
+                        delta = values[max_index] - values[i]
+            if values[start] >= values[stop]:
+                min_index = start
+                for i in xrange(start + 1, stop + 1):
+                    if values[i] < values[min_index]:
+                        min_index = i
+                    elif values[i] - values[min_index] > delta:
+                        left, right = min_index, i
+                        delta = values[i] - values[min_index]
         if delta >= epsilon and (left != start or right != stop):
-            result.add(left)
-            result.add(right)
-            helper(start, left)
-            helper(left, right)
-            helper(right, stop)
+            yield (indexes[left], indexes[right], delta)
+            stack.append((right, stop))
+            stack.append((left, right))
+            stack.append((start, left))
+
+
+def salient(seq, epsilon=0):
     result = set()
     if len(seq):
         result.add(0)
         result.add(len(seq) - 1)
-        helper(0, len(seq) - 1)
+        for left, right, delta in salient_spans(seq, epsilon):
+            result.add(left)
+            result.add(right)
     return sorted(result)
 
 
 def salient2(seq, epsilons):
-    def helper(start, stop):
-        if stop - start < 2:
-            return
-        delta = 0
-        left, right = start, stop
-        if seq[start] <= seq[stop]:
-            max_index = start
-            for i in xrange(start + 1, stop + 1):
-                if seq[i] > seq[max_index]:
-                    max_index = i
-                elif seq[max_index] - seq[i] > delta:
-                    left, right = max_index, i
-                    delta = seq[max_index] - seq[i]
-        if seq[start] >= seq[stop]:
-            min_index = start
-            for i in xrange(start + 1, stop + 1):
-                if seq[i] < seq[min_index]:
-                    min_index = i
-                elif seq[i] - seq[min_index] > delta:
-                    left, right = min_index, i
-                    delta = seq[i] - seq[min_index]
-        if delta >= epsilons[-1] and (left != start or right != stop):
+    result = {}
+    if len(seq):
+        result[0] = 0
+        result[len(seq) - 1] = 0
+        for left, right, delta in salient_spans(seq, epsilons[-1]):
             for i, epsilon in enumerate(epsilons):
                 if delta < epsilon:
                     continue
@@ -288,27 +703,55 @@ def salient2(seq, epsilons):
                     result[left] = i
                 if not right in result or result[right] > i:
                     result[right] = i
-            helper(start, left)
-            helper(left, right)
-            helper(right, stop)
-    result = {}
-    if len(seq):
-        result[0] = 0
-        result[len(seq) - 1] = 0
-        helper(0, len(seq) - 1)
     return result.items()
 
 
-def datetime_floor(dt, delta):
-    if delta.seconds >= 3600:
-        return dt.replace(minute=0, second=0) \
-               - datetime.timedelta(0, 3600 * (dt.hour
-                                               % int(delta.seconds / 3600)))
-    elif delta.seconds >= 60:
-        return dt.replace(second=0) \
-               - datetime.timedelta(0, 60 * (dt.minute
-                                             % int(delta.seconds / 60)))
-    elif delta.seconds >= 1:
-        return dt - datetime.timedelta(0, dt.second % delta.seconds)
+def splitext(filename):
+    """Split filename into root and extension, ignoring any compression
+    extension."""
+    root, ext = os.path.splitext(filename)
+    if ext.lower() in ('.bz2', '.gz'):
+        root, ext = os.path.splitext(root)
+    return root, ext
+
+
+def open_inputs(filename, exts=None):
+    """Yield (name, file) for each input file in filename.
+
+    filename may be a plain file, a gzip or bzip2 compressed file, or a zip
+    archive.  Compressed files are decompressed as they are read and zip
+    archive members are read directly, without being extracted.  name is the
+    name of the file without any compression extension, or the name of the
+    archive member.  If exts is given then only archive members with those
+    extensions are yielded.  Each archive member must be read before the
+    next is yielded, and the archive is closed once they all have been.
+
+    """
+    ext = os.path.splitext(filename)[1].lower()
+    if ext == '.gz':
+        yield os.path.splitext(filename)[0], gzip.open(filename)
+    elif ext == '.bz2':
+        yield os.path.splitext(filename)[0], bz2.BZ2File(filename)
+    elif ext == '.zip':
+        zf = zipfile.ZipFile(filename)
+        try:
+            for name in zf.namelist():
+                if name.endswith('/'):
+                    continue
+                if exts is None or os.path.splitext(name)[1].lower() in exts:
+                    yield name, zf.open(name)
+        finally:
+            zf.close()
     else:
-        return dt
+        yield filename, open(filename)
+
+
+def time_floor(t, step):
+    """Return the seconds since the UTC epoch t rounded down to a multiple of
+    step seconds, which should divide a day or be a whole number of days."""
+    return int(t - t % step)
+
+
+def strftime(format, t):
+    """Return the seconds since the UTC epoch t formatted as time.strftime."""
+    return time.strftime(format, time.gmtime(t))
@@ -0,0 +1,86 @@
+#!/usr/bin/python
+#
+#   test/bench_igc.py  igc2kmz IGC benchmarks
+#   Copyright (C) 2008  Tom Payne
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import glob
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import igc2kmz.igc
+
+
+EXAMPLES = os.path.join(os.path.dirname(__file__), '..', 'examples', '*.igc')
+
+
+def best_of(n, f, *args):
+    result = None
+    for i in xrange(0, n):
+        start = time.time()
+        f(*args)
+        elapsed = time.time() - start
+        if result is None or elapsed < result:
+            result = elapsed
+    return result
+
+
+def b_records(filename):
+    return [line.rstrip() for line in open(filename) if line.startswith('B')]
+
+
+def split_all(lines, fields):
+    for line in lines:
+        try:
+            fields(line)
+        except igc2kmz.igc.SyntaxError:
+            pass
+
+
+def bench_b_record_fields(filename):
+    lines = b_records(filename)
+    for line in lines:
+        try:
+            expected = igc2kmz.igc.BRecord.fields_re(line)
+        except igc2kmz.igc.SyntaxError:
+            expected = None
+        try:
+            actual = igc2kmz.igc.BRecord.fields(line)
+        except igc2kmz.igc.SyntaxError:
+            actual = None
+        if actual != expected:
+            raise AssertionError('%s: %s != %s for %s'
+                                 % (filename, repr(actual), repr(expected),
+                                    repr(line)))
+    regex = best_of(5, split_all, lines, igc2kmz.igc.BRecord.fields_re)
+    fixed = best_of(5, split_all, lines, igc2kmz.igc.BRecord.fields)
+    parse = best_of(5, lambda: igc2kmz.igc.IGC(open(filename)))
+    print '%s: %d B records, regex %.1fms, fixed %.1fms (%.1fx), ' \
+          'IGC %.1fms' % (os.path.basename(filename), len(lines),
+                          1000 * regex, 1000 * fixed, regex / fixed,
+                          1000 * parse)
+
+
+def main(argv):
+    for filename in argv[1:] or sorted(glob.glob(EXAMPLES)):
+        bench_b_record_fields(filename)
+
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -0,0 +1,91 @@
+#!/usr/bin/python
+#
+#   test/bench_track.py  igc2kmz track benchmarks
+#   Copyright (C) 2008  Tom Payne
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import glob
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import igc2kmz.igc
+from igc2kmz.track import Track
+
+
+EXAMPLES = os.path.join(os.path.dirname(__file__), '..', 'examples', '*.igc')
+
+
+def best_of(n, f, *args):
+    result = None
+    for i in xrange(0, n):
+        start = time.time()
+        f(*args)
+        elapsed = time.time() - start
+        if result is None or elapsed < result:
+            result = elapsed
+    return result
+
+
+def header(coords):
+    """Use the track as a flight log summary does."""
+    track = Track(coords)
+    return (track.t[0], track.t[-1], track.coords[0], track.coords[-1])
+
+
+def task(coords):
+    """Use the track as task scoring does."""
+    track = Track(coords)
+    return track.coords_at(xrange(track.t[0], track.t[-1], 60))
+
+
+def bounds(coords):
+    """Use the bounds of the track's altitude and time."""
+    track = Track(coords)
+    return (track.bounds.ele, track.bounds.time)
+
+
+def speed(coords):
+    """Use a single series of the track."""
+    return Track(coords).speed
+
+
+def full(coords):
+    """Use the whole analysis of the track."""
+    track = Track(coords)
+    track.evaluate()
+    return track
+
+
+def bench_track(filename):
+    coords = igc2kmz.igc.IGC(open(filename)).b.coords()
+    times = [best_of(5, f, coords)
+             for f in (full, header, task, bounds, speed)]
+    print '%s: %d fixes, full %.1fms, header %.1fms (%.1fx), ' \
+          'task %.1fms (%.1fx), bounds %.1fms (%.1fx), speed %.1fms (%.1fx)' \
+          % ((os.path.basename(filename), len(coords), 1000 * times[0])
+             + tuple(x for t in times[1:] for x in (1000 * t, times[0] / t)))
+
+
+def main(argv):
+    for filename in argv[1:] or sorted(glob.glob(EXAMPLES)):
+        bench_track(filename)
+
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -0,0 +1,117 @@
+#!/usr/bin/python
+#
+#   test/bench_util.py  igc2kmz utility benchmarks
+#   Copyright (C) 2008  Tom Payne
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import glob
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import igc2kmz.igc
+import igc2kmz.util
+from test_util import reference_douglas_peucker, reference_salient2, spiral
+
+
+EXAMPLES = os.path.join(os.path.dirname(__file__), '..', 'examples', '*.igc')
+
+
+def timed(f, *args):
+    start = time.time()
+    result = f(*args)
+    return (result, time.time() - start)
+
+
+def bench_douglas_peucker(n):
+    x, y = spiral(n)
+    expected, scan = timed(reference_douglas_peucker, x, y, 1.0)
+    actual, hull = timed(igc2kmz.util.douglas_peucker, x, y, 1.0)
+    if actual != expected:
+        raise AssertionError('spiral of %d points: results differ' % n)
+    print 'spiral of %d points: %d indexes, scan %.1fms, hull tree %.1fms ' \
+          '(%.1fx)' % (n, len(actual), 1000 * scan, 1000 * hull, scan / hull)
+
+
+def bench_graph(filename):
+    """Simplify the altitude graph of filename as Flight.make_graph does,
+    never using a HullTree, using one regardless of the number of points,
+    and by default."""
+    track = igc2kmz.igc.IGC(open(filename)).track()
+    t0, t1 = track.t[0], track.t[-1]
+    x = [600.0 * (t - t0) / (t1 - t0) for t in track.t]
+    ele = track.elevations()
+    lo, hi = min(ele), max(ele)
+    y = [300.0 * (e - lo) / (hi - lo) for e in ele]
+    default = igc2kmz.util.FarthestPoints.min_tree_length
+    times = []
+    for min_tree_length in (sys.maxint, 0, default):
+        igc2kmz.util.FarthestPoints.min_tree_length = min_tree_length
+        try:
+            results = [timed(igc2kmz.util.incr_douglas_peucker, x, y, 1, 450)
+                       for i in xrange(0, 5)]
+        finally:
+            igc2kmz.util.FarthestPoints.min_tree_length = default
+        if results[0][0] != results[-1][0] or \
+           times and results[0][0] != expected:
+            raise AssertionError('%s: results differ' % filename)
+        expected = results[0][0]
+        times.append(min(elapsed for indexes, elapsed in results))
+    print '%s: %d points, scan %.1fms, hull tree %.1fms (%.1fx), ' \
+          'default %.1fms (%.1fx)' \
+          % (os.path.basename(filename), len(x), 1000 * times[0],
+             1000 * times[1], times[0] / times[1], 1000 * times[2],
+             times[0] / times[2])
+
+
+def bench_visvalingam_whyatt(n):
+    x, y = spiral(n)
+    ranking, rank = timed(igc2kmz.util.visvalingam_whyatt_ranking, x, y)
+    budgets = []
+    for k in (100, 1000, 10000):
+        indexes, cut = timed(igc2kmz.util.visvalingam_whyatt, x, y, 0, k,
+                             ranking)
+        budgets.append('%d points %.1fms' % (len(indexes), 1000 * cut))
+    print 'spiral of %d points: ranking %.1fms, then %s' \
+          % (n, 1000 * rank, ', '.join(budgets))
+
+
+def bench_salient2(n):
+    # A ten second climb and a ten second sink, at 1Hz, climbing overall
+    seq = [i // 2 + 12 * (i % 20 < 10) for i in xrange(0, n)]
+    expected, scan = timed(reference_salient2, seq, [100, 50, 10])
+    actual, tree = timed(igc2kmz.util.salient2, seq, [100, 50, 10])
+    if sorted(actual) != expected:
+        raise AssertionError('sawtooth of %d points: results differ' % n)
+    print 'sawtooth of %d points: %d indexes, scan %.1fms, swing tree ' \
+          '%.1fms (%.1fx)' % (n, len(actual), 1000 * scan, 1000 * tree,
+                              scan / tree)
+
+
+def main(argv):
+    for n in map(int, argv[1:]) or (1000, 10000, 100000):
+        bench_douglas_peucker(n)
+        bench_visvalingam_whyatt(n)
+    for n in map(int, argv[1:]) or (3600, 36000):
+        bench_salient2(n)
+    for filename in sorted(glob.glob(EXAMPLES)):
+        bench_graph(filename)
+
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -0,0 +1,149 @@
+#!/usr/bin/python
+#
+#   test/test_cache.py  igc2kmz track cache unit tests
+#   Copyright (C) 2008  Tom Payne
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from igc2kmz.cache import Cache, dumps, loads
+from igc2kmz.coord import CoordArray
+from igc2kmz.geodesy import Trig
+from igc2kmz.igc import IGC
+from igc2kmz.util import BoundsSet
+
+
+EXAMPLES = os.path.join(os.path.dirname(__file__), '..', 'examples')
+
+
+def load(name):
+    filename = os.path.join(EXAMPLES, name)
+    return IGC(open(filename), filename=filename).track()
+
+
+class TestDumps(unittest.TestCase):
+
+    def assertTrackEqual(self, track0, track1):
+        self.assertEqual(sorted(track0.__dict__), sorted(track1.__dict__))
+        for key, value in track0.__dict__.items():
+            other = track1.__dict__[key]
+            if isinstance(value, CoordArray):
+                for name in ('lat', 'lon', 'ele', 't'):
+                    self.assertEqual(value.column(name), other.column(name))
+            elif isinstance(value, Trig):
+                for name in ('lat', 'lon', 'sin_lat', 'cos_lat'):
+                    self.assertEqual(getattr(value, name),
+                                     getattr(other, name))
+            elif isinstance(value, BoundsSet):
+                self.assertEqual(
+                        dict((k, b.tuple()) for k, b in value.__dict__.items()),
+                        dict((k, b.tuple()) for k, b in other.__dict__.items()))
+            else:
+                self.assertEqual(value, other, key)
+
+    def test_round_trip(self):
+        for name in ('858umbh1.igc', '2008-05-12-CGP-XDFE-01.igc'):
+            track = load(name)
+            self.assertTrackEqual(loads(dumps(track)), track)
+
+    def test_trig(self):
+        track = load('858umbh1.igc')
+        data = dumps(track)
+        del track.trig
+        self.assertEqual(dumps(track), data)
+
+    def test_version(self):
+        data = dumps(load('858umbh1.igc'))
+        self.assertRaises(ValueError, loads, 'not a track')
+        index = data.index('\n') + 1
+        self.assertRaises(ValueError, loads,
+                          data[:index] + chr(ord(data[index]) + 1)
+                          + data[index + 1:])
+
+
+class TestCache(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.track = load('858umbh1.igc')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_key(self):
+        cache = Cache(self.directory)
+        self.assertEqual(cache.key('data', '.igc', ()),
+                         cache.key('data', '.igc', ()))
+        self.assertNotEqual(cache.key('data', '.igc', ()),
+                            cache.key('data2', '.igc', ()))
+        self.assertNotEqual(cache.key('data', '.igc', ()),
+                            cache.key('data', '.gpx', ()))
+        self.assertNotEqual(cache.key('data', '.igc', ()),
+                            cache.key('data', '.igc', (60,)))
+
+    def test_get_put(self):
+        cache = Cache(self.directory)
+        key = cache.key('data')
+        self.assertEqual(cache.get(key), None)
+        cache.put(key, self.track)
+        track = cache.get(key)
+        self.assertEqual(track.coords.column('t'),
+                         self.track.coords.column('t'))
+        self.assertEqual(track.speed, self.track.speed)
+
+    def test_rename(self):
+        cache = Cache(self.directory)
+        data = open(os.path.join(EXAMPLES, '858umbh1.igc')).read()
+        key = cache.key(data, '.igc', ())
+        cache.put(key, self.track)
+        self.assertEqual(cache.get(key).filename, '858umbh1.igc')
+        self.assertEqual(cache.get(key, 'b.igc').filename, 'b.igc')
+        self.assertEqual(cache.get(key).filename, '858umbh1.igc')
+
+    def test_corrupt(self):
+        cache = Cache(self.directory)
+        key = cache.key('data')
+        cache.put(key, self.track)
+        data = open(cache.filename(key), 'rb').read()
+        for corrupt in ('', data[:len(data) // 2],
+                        data[:-64] + '\xff' * 64,
+                        data[:40] + '\x00' * (len(data) - 40)):
+            open(cache.filename(key), 'wb').write(corrupt)
+            self.assertEqual(cache.get(key), None)
+
+    def test_evict(self):
+        cache = Cache(self.directory)
+        keys = [cache.key('data%d' % i) for i in xrange(0, 3)]
+        for i, key in enumerate(keys):
+            cache.put(key, self.track)
+            os.utime(cache.filename(key), (1000000 * i, 1000000 * i))
+        # Reading an entry makes it the most recently used
+        self.assertNotEqual(cache.get(keys[0]), None)
+        cache.max_size = 2 * os.path.getsize(cache.filename(keys[0]))
+        cache.evict()
+        self.assertEqual(sorted(os.listdir(self.directory)),
+                         sorted(cache.filename(key)[len(self.directory) + 1:]
+                                for key in (keys[0], keys[2])))
+
+
+if __name__ == '__main__':
+    unittest.main()
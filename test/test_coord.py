@@ -0,0 +1,148 @@
+#!/usr/bin/python
+#
+#   test/test_coord.py  igc2kmz coordinate unit tests
+#   Copyright (C) 2008  Tom Payne
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import datetime
+import glob
+import os.path
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from igc2kmz.coord import Coord, CoordArray
+from igc2kmz import geodesy
+from igc2kmz.igc import IGC
+
+
+DT = datetime.datetime(2008, 7, 1, 12, 0, 0)
+EXAMPLES = os.path.join(os.path.dirname(__file__), '..', 'examples', '*.igc')
+
+
+def coords(n):
+    return [Coord.deg(45.0 + 0.01 * i, 6.0 + 0.02 * i * i, 1000 + 10 * i,
+                      DT + datetime.timedelta(seconds=i))
+            for i in xrange(0, n)]
+
+
+class TestCoordArray(unittest.TestCase):
+
+    def setUp(self):
+        self.coords = coords(10)
+        self.array = CoordArray.from_coords(self.coords)
+
+    def assertCoordsEqual(self, array, coords):
+        self.assertEqual(len(array), len(coords))
+        for c0, c1 in zip(array, coords):
+            self.assertEqual((c0.lat, c0.lon, c0.ele, c0.dt),
+                             (c1.lat, c1.lon, c1.ele, c1.dt))
+
+    def test_round_trip(self):
+        self.assertCoordsEqual(self.array, self.coords)
+        self.assertEqual(self.array.ele.typecode, 'l')
+
+    def test_index(self):
+        self.assertCoordsEqual([self.array[3], self.array[-1]],
+                               [self.coords[3], self.coords[-1]])
+        self.assertRaises(IndexError, lambda: self.array[10])
+
+    def test_slice(self):
+        view = self.array[2:8]
+        self.assertTrue(view.lat is self.array.lat)
+        self.assertCoordsEqual(view, self.coords[2:8])
+        self.assertCoordsEqual(view[1:-1], self.coords[3:7])
+        self.assertCoordsEqual(view[::2], self.coords[2:8:2])
+        self.assertCoordsEqual(self.array[8:2], [])
+        self.assertRaises(ValueError, view.append, self.coords[0])
+
+    def test_extend(self):
+        array = CoordArray.from_coords(self.coords[:4])
+        array.extend(self.array[4:])
+        self.assertCoordsEqual(array, self.coords)
+
+    def test_distance_to(self):
+        view = self.array[1:]
+        self.assertEqual(list(self.array[:-1].distance_to(view)),
+                         [c0.distance_to(c1) for c0, c1
+                          in zip(self.coords, self.coords[1:])])
+        self.assertEqual(list(view.distance_to(self.coords[0])),
+                         [c.distance_to(self.coords[0])
+                          for c in self.coords[1:]])
+
+    def test_initial_bearing_to(self):
+        self.assertEqual(list(self.array[:-1].initial_bearing_to(
+                                  self.array[1:])),
+                         [c0.initial_bearing_to(c1) for c0, c1
+                          in zip(self.coords, self.coords[1:])])
+
+    def test_halfway_to(self):
+        self.assertCoordsEqual(self.array[:-1].halfway_to(self.array[1:]),
+                               [c0.halfway_to(c1) for c0, c1
+                                in zip(self.coords, self.coords[1:])])
+
+    def test_interpolate(self):
+        deltas = [0.1 * i for i in xrange(0, 9)]
+        self.assertCoordsEqual(self.array[:-1].interpolate(self.array[1:],
+                                                           deltas),
+                               [c0.interpolate(c1, delta) for c0, c1, delta
+                                in zip(self.coords, self.coords[1:], deltas)])
+
+    def test_coord_at(self):
+        self.assertCoordsEqual(self.array.coord_at(1.0, 500.0),
+                               [c.coord_at(1.0, 500.0) for c in self.coords])
+
+
+class TestDistanceThreshold(unittest.TestCase):
+
+    def assertWithinBound(self, approximate, exact, threshold, message):
+        for d, expected in zip(approximate, exact):
+            error = abs(d - expected)
+            bound = geodesy.max_distance_error(expected, threshold)
+            self.assertTrue(error <= bound + 1e-9,
+                            '%s: error %gm exceeds bound %gm at %fm'
+                            % (message, error, bound, expected))
+
+    def test_examples(self):
+        for filename in sorted(glob.glob(EXAMPLES)):
+            array = IGC(open(filename)).b.coord_array()
+            coords = list(array)
+            name = os.path.basename(filename)
+            for step in 1, 10, 100:
+                exact = array[:-step].distance_to(array[step:])
+                for threshold in geodesy.DISTANCE_THRESHOLD, 10000.0:
+                    approximate = array[:-step].distance_to(array[step:],
+                                                            threshold)
+                    self.assertWithinBound(approximate, exact, threshold,
+                                           '%s step %d' % (name, step))
+                    self.assertEqual(list(approximate),
+                                     [c0.distance_to(c1, threshold)
+                                      for c0, c1
+                                      in zip(coords, coords[step:])])
+
+    def test_far(self):
+        c0 = Coord.deg(45.0, 6.0, 0)
+        c1 = Coord.deg(45.1, 6.0, 0)
+        self.assertEqual(c0.distance_to(c1, geodesy.DISTANCE_THRESHOLD),
+                         c0.distance_to(c1))
+        c1 = Coord.deg(45.0, -174.0, 0)
+        self.assertEqual(c0.distance_to(c1, geodesy.DISTANCE_THRESHOLD),
+                         c0.distance_to(c1))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -17,21 +17,290 @@
 #   along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 
+try:
+    import json
+except ImportError:
+    import simplejson as json
+from cStringIO import StringIO
+import glob
+import gzip
+import logging
+import multiprocessing
+import optparse
 import os
+import random
+import shutil
 import sys
+import tempfile
+import time
+import unittest
 
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
 
 import igc2kmz.igc
 
 
+EXAMPLES = os.path.join(os.path.dirname(__file__), '..', 'examples')
+
+
+def validate(filename):
+    """Parse filename and return a dict describing the result."""
+    result = {'filename': filename}
+    start = time.time()
+    try:
+        igc = igc2kmz.igc.IGC(open(filename))
+        result['invalid'] = len(igc.invalid)
+        result['fixes'] = len(igc.b)
+    except Exception, e:
+        result['error'] = '%s: %s' % (e.__class__.__name__, e)
+    result['time'] = round(time.time() - start, 6)
+    return result
+
+
+def regressions(result, baseline):
+    """Return a list of the ways in which result is worse than baseline."""
+    if baseline is None:
+        return []
+    if 'error' in result:
+        if 'error' in baseline:
+            return []
+        return ['error %s' % result['error']]
+    if 'error' in baseline:
+        return []
+    messages = []
+    if result['invalid'] > baseline['invalid']:
+        messages.append('invalid records %d -> %d'
+                        % (baseline['invalid'], result['invalid']))
+    if result['fixes'] != baseline['fixes']:
+        messages.append('fixes %d -> %d' % (baseline['fixes'], result['fixes']))
+    return messages
+
+
 def main(argv):
-    for arg in argv[1:]:
+    parser = optparse.OptionParser(
+            usage='Usage: %prog [options] filename.igc ...',
+            description='Validate IGC files in parallel, writing one JSON '
+                        'object per file')
+    parser.add_option('-j', '--jobs', metavar='NUMBER', type='int',
+                      help='set number of worker processes')
+    parser.add_option('-b', '--baseline', metavar='FILENAME',
+                      help='compare results with a previous run')
+    parser.add_option('-v', '--verbose', action='store_true',
+                      help='log invalid records')
+    parser.set_defaults(jobs=multiprocessing.cpu_count())
+    options, args = parser.parse_args(argv)
+    if not options.verbose:
+        logging.disable(logging.WARNING)
+    baselines = {}
+    if options.baseline:
+        for line in open(options.baseline):
+            if line.strip():
+                baseline = json.loads(line)
+                baselines[baseline['filename']] = baseline
+    filenames = args[1:]
+    if options.jobs > 1 and len(filenames) > 1:
+        pool = multiprocessing.Pool(options.jobs)
+        chunksize = max(1, min(64, len(filenames) / (4 * options.jobs)))
+        results = pool.imap_unordered(validate, filenames, chunksize)
+    else:
+        pool = None
+        results = (validate(filename) for filename in filenames)
+    status = 0
+    for result in results:
+        print json.dumps(result, sort_keys=True)
+        sys.stdout.flush()
+        for message in regressions(result, baselines.get(result['filename'])):
+            sys.stderr.write('%s: %s\n' % (result['filename'], message))
+            status = 1
+    if pool:
+        pool.close()
+        pool.join()
+    return status
+
+
+class TestRegressions(unittest.TestCase):
+
+    baseline = {'filename': 'a.igc', 'invalid': 1, 'fixes': 100, 'time': 0.1}
+
+    def result(self, **kwargs):
+        result = dict(self.baseline)
+        result.update(kwargs)
+        return result
+
+    def test_pass(self):
+        self.assertEqual(regressions(self.result(), None), [])
+        self.assertEqual(regressions(self.result(), self.baseline), [])
+        self.assertEqual(regressions(self.result(invalid=0, time=1.0),
+                                     self.baseline), [])
+        error = {'filename': 'a.igc', 'error': 'IOError: x', 'time': 0.1}
+        self.assertEqual(regressions(self.result(), error), [])
+        self.assertEqual(regressions(error, error), [])
+
+    def test_fail(self):
+        self.assertEqual(regressions(self.result(invalid=2), self.baseline),
+                         ['invalid records 1 -> 2'])
+        self.assertEqual(regressions(self.result(fixes=99), self.baseline),
+                         ['fixes 100 -> 99'])
+        self.assertEqual(regressions(self.result(fixes=101), self.baseline),
+                         ['fixes 100 -> 101'])
+        self.assertEqual(regressions(self.result(invalid=2, fixes=99),
+                                     self.baseline),
+                         ['invalid records 1 -> 2', 'fixes 100 -> 99'])
+        error = {'filename': 'a.igc', 'error': 'IOError: x', 'time': 0.1}
+        self.assertEqual(regressions(error, self.baseline),
+                         ['error IOError: x'])
+
+    def test_validate(self):
+        filename = os.path.join(EXAMPLES, '858umbh1.igc')
+        result = validate(filename)
+        self.assertEqual(result['fixes'], 3391)
+        self.assertEqual(regressions(result, result), [])
+        messages = regressions(validate(filename + '.missing'), result)
+        self.assertEqual(len(messages), 1)
+        self.assertTrue(messages[0].startswith('error IOError: '))
+
+
+def truncated(filename):
+    """Return the contents of filename up to half way through its last B
+    record, as if it was still being written."""
+    lines = open(filename).read().splitlines(True)
+    last = max(i for i, line in enumerate(lines) if line.startswith('B'))
+    return ''.join(lines[:last]) + lines[last][:len(lines[last]) // 2]
+
+
+class TestIterFixes(unittest.TestCase):
+
+    def check(self, data):
+        b = igc2kmz.igc.IGC(StringIO(data)).b
+        fixes = list(igc2kmz.igc.iter_fixes(StringIO(data)))
+        self.assertEqual(len(fixes), len(b))
+        for i, fix in enumerate(fixes):
+            self.assertEqual(fix.__dict__, b[i].__dict__)
+        return fixes
+
+    def test_examples(self):
+        for filename in sorted(glob.glob(os.path.join(EXAMPLES, '*.igc'))):
+            self.check(open(filename).read())
+
+    def test_truncated(self):
+        filename = os.path.join(EXAMPLES, '858umbh1.igc')
+        logging.disable(logging.WARNING)
         try:
-            igc2kmz.igc.IGC(open(arg))
-        except igc2kmz.igc.SyntaxError, line:
-            print "%s: %s" % (arg, line)
+            fixes = self.check(truncated(filename))
+        finally:
+            logging.disable(logging.NOTSET)
+        self.assertEqual(len(fixes),
+                         len(igc2kmz.igc.IGC(open(filename)).b) - 1)
+
+
+class TestTail(unittest.TestCase):
+
+    keys = 't s ele speed climb tec progress state thermals glides dives ' \
+           'rejected'
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def assertTrackEqual(self, track, expected):
+        for column in ('lat', 'lon', 'ele', 't'):
+            self.assertEqual([getattr(c, column) for c in track.coords],
+                             list(expected.coords.column(column)))
+        for key in self.keys.split():
+            self.assertEqual(getattr(track, key), getattr(expected, key), key)
+
+    def test_chunks(self):
+        random.seed(0)
+        for name in ('858umbh1.igc', '2008-05-12-CGP-XDFE-01.igc'):
+            data = open(os.path.join(EXAMPLES, name)).read()
+            expected = igc2kmz.igc.IGC(StringIO(data)).track()
+            filename = os.path.join(self.directory, name)
+            file = open(filename, 'wb')
+            tail = igc2kmz.igc.Tail(filename)
+            position = 0
+            while position < len(data):
+                size = random.randint(1, 8192)
+                file.write(data[position:position + size])
+                file.flush()
+                position += size
+                track = tail.update()
+                # Analyse some of the partial tracks, so that later chunks
+                # are analysed incrementally
+                if track is not None and random.random() < 0.2:
+                    getattr(track, random.choice(self.keys.split()))
+            file.close()
+            self.assertTrackEqual(tail.update(), expected)
+
+    def test_gnss_lock(self):
+        # A GNSS-only logger records zero pressure altitude throughout, and
+        # zero GNSS altitude until it has a lock
+        lines = open(os.path.join(EXAMPLES, '2008-05-12-CGP-XDFE-01.igc'))
+        lines = lines.read().splitlines(True)
+        b = [i for i, line in enumerate(lines) if line.startswith('B')]
+        for i in b[:100]:
+            self.assertEqual(lines[i][25:30], '00000')
+            lines[i] = lines[i][:30] + '00000' + lines[i][35:]
+        filename = os.path.join(self.directory, 'gnss.igc')
+        file = open(filename, 'wb')
+        tail = igc2kmz.igc.Tail(filename)
+        for chunk in (lines[:b[50]], lines[b[50]:b[150]], lines[b[150]:]):
+            file.write(''.join(chunk))
+            file.flush()
+            track = tail.update()
+            data = open(filename).read()
+            self.assertTrackEqual(track,
+                                  igc2kmz.igc.IGC(StringIO(data)).track())
+        file.close()
+        self.assertTrue(max(c.ele for c in track.coords) > 0)
+
+
+class Unseekable(object):
+    """A file that can only be read forwards."""
+
+    def __init__(self, file):
+        self.file = file
+
+    def __iter__(self):
+        return iter(self.file.readline, '')
+
+    def readline(self):
+        return self.file.readline()
+
+
+class TestScan(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def check(self, filename, file):
+        igc = igc2kmz.igc.IGC(open(filename))
+        summary = igc2kmz.igc.scan(file)
+        self.assertEqual(summary.a, igc.a)
+        self.assertEqual(summary.h, igc.h)
+        self.assertEqual(summary.first.__dict__, igc.b[0].__dict__)
+        self.assertEqual(summary.last.__dict__, igc.b[-1].__dict__)
+
+    def test_plain(self):
+        filename = os.path.join(EXAMPLES, '858umbh1.igc')
+        self.check(filename, open(filename))
+
+    def test_gzip(self):
+        filename = os.path.join(EXAMPLES, '858umbh1.igc')
+        gzfilename = os.path.join(self.directory, '858umbh1.igc.gz')
+        gzfile = gzip.open(gzfilename, 'wb')
+        gzfile.write(open(filename).read())
+        gzfile.close()
+        self.check(filename, gzip.open(gzfilename))
+
+    def test_unseekable(self):
+        filename = os.path.join(EXAMPLES, '858umbh1.igc')
+        self.check(filename, Unseekable(open(filename)))
 
 
 if __name__ == '__main__':
-    main(sys.argv)
+    sys.exit(main(sys.argv))
@@ -0,0 +1,138 @@
+#!/usr/bin/python
+#
+#   test/test_igc2kmz.py  igc2kmz conversion tests
+#   Copyright (C) 2008  Tom Payne
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import datetime
+import os.path
+import re
+import shutil
+import sys
+import tempfile
+import unittest
+import zipfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from igc2kmz import Flight, Stock, flights2kmz
+from igc2kmz.coord import Coord
+from igc2kmz.igc import IGC
+from igc2kmz.track import LOD_TOLERANCES, Track
+from igc2kmz.util import OpenStruct, open_inputs
+
+
+EXAMPLES = os.path.join(os.path.dirname(__file__), '..', 'examples')
+
+
+class TestZip(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_several_days(self):
+        filename = os.path.join(self.directory, 'flights.zip')
+        zf = zipfile.ZipFile(filename, 'w')
+        for name in ('2008-05-02_Martin_Saleve-Tessin.igc',
+                     '2008-05-12-CGP-XDFE-01.igc'):
+            zf.write(os.path.join(EXAMPLES, name), name)
+        zf.close()
+        flights = [Flight(IGC(file, filename=name).track())
+                   for name, file in open_inputs(filename, ('.igc',))]
+        self.assertEqual(len(flights), 2)
+        output = os.path.join(self.directory, 'flights.kmz')
+        flights2kmz(flights).write(output, '2.2')
+        zf = zipfile.ZipFile(output)
+        try:
+            self.assertTrue('doc.kml' in zf.namelist())
+        finally:
+            zf.close()
+
+
+class TestWindows(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_graphs(self):
+        filename = os.path.join(EXAMPLES, '858umbh1.igc')
+        track = IGC(open(filename), filename=filename).track(windows=(5, 60))
+        output = os.path.join(self.directory, 'flight.kmz')
+        flights2kmz([Flight(track)]).write(output, '2.2')
+        zf = zipfile.ZipFile(output)
+        try:
+            kml = zf.read('doc.kml')
+        finally:
+            zf.close()
+        for window in (5, 60):
+            for name in ('Colored by climb over %ds',
+                         'Colored by ground speed over %ds',
+                         'Climb graph over %ds',
+                         'Ground speed graph over %ds'):
+                self.assertTrue('<name>%s</name>' % (name % window) in kml)
+
+
+class TestRegions(unittest.TestCase):
+
+    def test_thin(self):
+        """A track that runs due north still switches between levels."""
+        dt = datetime.datetime(2008, 7, 1, 12, 0, 0)
+        coords = [Coord.deg(45.0 + 0.0001 * i, 6.0, 1000,
+                            dt + datetime.timedelta(seconds=i))
+                  for i in xrange(0, 1000)]
+        regions = Flight(Track(coords)).make_regions(OpenStruct(lod=True))
+        self.assertEqual([level for level, region in regions],
+                         range(0, len(LOD_TOLERANCES) + 1))
+        pixels = [map(int, re.findall(r'LodPixels>(-?\d+)<', str(region)))
+                  for level, region in regions]
+        self.assertEqual(pixels[0][1], -1)
+        self.assertEqual(pixels[-1][0], 0)
+        for (min0, max0), (min1, max1) in zip(pixels, pixels[1:]):
+            self.assertEqual(max1, min0)
+            self.assertTrue(min1 < max1)
+        # The track is about 11km long, and is drawn at full detail once it
+        # is about 11km / 10m pixels across
+        self.assertTrue(1000 < pixels[0][0] < 1200)
+
+    def test_shadow(self):
+        filename = os.path.join(EXAMPLES, '858umbh1.igc')
+        flight = Flight(IGC(open(filename), filename=filename).track())
+        levels = len(LOD_TOLERANCES) + 1
+        for lod, level, expected in ((True, 0, [levels] * 3),
+                                     (False, 0, [0] * 3),
+                                     (False, 2, [0] * 3)):
+            globals = OpenStruct(stock=Stock(), lod=lod)
+            folder = flight.make_shadow_folder(globals, level)
+            tracks = [str(element) for element in folder.elements[0].children
+                      if 'LineString' in str(element)]
+            self.assertEqual([track.count('<Region>') for track in tracks],
+                             expected)
+            if not lod:
+                coords = [re.search(r'<coordinates>(.*)</coordinates>',
+                                    track, re.S).group(1).split()
+                          for track in tracks]
+                self.assertEqual(map(len, coords),
+                                 [len(flight.track.lod[level])] * 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
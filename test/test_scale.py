@@ -0,0 +1,53 @@
+#!/usr/bin/python
+#
+#   test/test_scale.py  igc2kmz scale unit tests
+#   Copyright (C) 2008  Tom Payne
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import os.path
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from igc2kmz.scale import TimeScale
+
+
+class TestTimeScale(unittest.TestCase):
+
+    def test_hours(self):
+        scale = TimeScale((1214913600 + 600, 1214913600 + 5 * 3600 + 60))
+        self.assertEqual(scale.step, 30 * 60)
+        self.assertEqual(scale.range, (1214913600, 1214913600 + 5.5 * 3600))
+        self.assertEqual(scale.labels[:2], ['12:30', '13:00'])
+
+    def test_days(self):
+        scale = TimeScale((1214913600, 1214913600 + 10 * 86400))
+        self.assertEqual(scale.step, 86400)
+        self.assertEqual(scale.labels[0], '2008-07-02')
+
+    def test_weeks(self):
+        lower = 1214913600
+        scale = TimeScale((lower, lower + 365 * 86400))
+        self.assertEqual(scale.step, 14 * 86400)
+        self.assertTrue(scale.range[0] <= lower)
+        self.assertTrue(scale.range[1] >= lower + 365 * 86400)
+        self.assertTrue(scale.labels)
+        self.assertEqual(len(scale.labels), len(scale.positions))
+
+
+if __name__ == '__main__':
+    unittest.main()
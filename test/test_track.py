@@ -0,0 +1,337 @@
+#!/usr/bin/python
+#
+#   test/test_track.py  igc2kmz track unit tests
+#   Copyright (C) 2008  Tom Payne
+#
+#   This program is free software: you can redistribute it and/or modify
+#   it under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#   GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License
+#   along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import datetime
+import os.path
+import sys
+import time
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from igc2kmz.coord import Coord, CoordArray
+import igc2kmz.geodesy
+from igc2kmz.igc import IGC
+import igc2kmz.track
+from igc2kmz.track import Track
+import igc2kmz.util
+
+
+EXAMPLES = os.path.join(os.path.dirname(__file__), '..', 'examples')
+
+
+def straight(n, spikes={}):
+    """Return n coords one second and about 10m apart, replacing the
+    elevations of the indexes in spikes."""
+    dt = datetime.datetime(2008, 7, 1, 12, 0, 0)
+    return [Coord.deg(45.0 + 0.0001 * i, 6.0, spikes.get(i, 1000),
+                      dt + datetime.timedelta(seconds=i))
+            for i in xrange(0, n)]
+
+
+def sawtooth(n=300):
+    """Return n straight coords that climb 250m in 5m steps every 50s."""
+    return straight(n, dict((i, 1000 + 5 * (i % 50)) for i in xrange(0, n)))
+
+
+class TestFilter(unittest.TestCase):
+
+    def filter(self, coords, last_c=None, offset=0):
+        rejected = []
+        result = Track.filter(coords, last_c, rejected, offset)
+        return ([coords.index(c) for c in result], rejected)
+
+    def test_clean(self):
+        self.assertEqual(self.filter(straight(10)), (range(0, 10), []))
+
+    def test_spike(self):
+        indexes, rejected = self.filter(straight(10, {4: 2000}))
+        self.assertEqual(indexes, [0, 1, 2, 3, 5, 6, 7, 8, 9])
+        self.assertEqual(rejected, [(4, 'climb')])
+
+    def test_leading_spike(self):
+        indexes, rejected = self.filter(straight(10, {0: 2000}))
+        self.assertEqual(indexes, range(1, 10))
+        self.assertEqual(rejected, [(0, 'climb')])
+
+    def test_leading_spikes(self):
+        indexes, rejected = self.filter(straight(20, {0: 2000, 2: 3000}))
+        self.assertEqual(indexes, [1] + range(3, 20))
+        self.assertEqual(rejected, [(0, 'climb'), (2, 'climb')])
+
+    def test_time(self):
+        coords = straight(5)
+        coords.insert(3, coords[2].dup())
+        indexes, rejected = self.filter(coords)
+        self.assertEqual(indexes, [0, 1, 2, 4, 5])
+        self.assertEqual(rejected, [(3, 'time')])
+
+    def test_speed(self):
+        coords = straight(10)
+        coords[6] = Coord.deg(46.0, 6.0, 1000, coords[6].dt)
+        indexes, rejected = self.filter(coords)
+        self.assertEqual(indexes, [0, 1, 2, 3, 4, 5, 7, 8, 9])
+        self.assertEqual(rejected, [(6, 'speed')])
+
+    def test_last_c(self):
+        coords = straight(10, {5: 2000})
+        indexes, rejected = self.filter(coords[4:], coords[3], 4)
+        self.assertEqual(indexes, [0, 2, 3, 4, 5])
+        self.assertEqual(rejected, [(5, 'climb')])
+
+    def test_numpy(self):
+        if igc2kmz.track.numpy is None:
+            return
+        coords = straight(1000, {0: 2000, 100: 2000, 500: 0, 501: 0})
+        numpy = igc2kmz.track.numpy
+        try:
+            igc2kmz.track.numpy = None
+            expected = self.filter(coords)
+        finally:
+            igc2kmz.track.numpy = numpy
+        self.assertEqual(self.filter(coords), expected)
+
+
+class TestExtend(unittest.TestCase):
+
+    def test_rejected(self):
+        coords = straight(200, {150: 2000})
+        track = Track(coords[:100])
+        track.extend(coords[100:])
+        self.assertEqual(track.coords, coords[:150] + coords[151:])
+        self.assertEqual(track.rejected, [(150, 'climb')])
+
+
+class TestCoordArray(unittest.TestCase):
+
+    def test_analyse(self):
+        coords = sawtooth()
+        expected = Track(coords)
+        track = Track(CoordArray.from_coords(coords[:200]))
+        track.extend(CoordArray.from_coords(coords[200:]))
+        self.assertTrue(isinstance(track.coords, CoordArray))
+        for key in 't s ele speed climb tec progress state'.split():
+            self.assertEqual(getattr(track, key), getattr(expected, key))
+
+
+class TestLazy(unittest.TestCase):
+
+    keys = 't s ele speed climb tec progress state thermals glides dives'
+
+    def test_lazy(self):
+        track = Track(sawtooth())
+        for key in 'bounds speed state'.split():
+            self.assertFalse(key in track.__dict__)
+        track.bounds.ele
+        self.assertFalse('speed' in track.__dict__)
+        self.assertEqual(sorted(track.bounds.__dict__), ['ele', 't', 'time'])
+        track.speed
+        for key in 'climb tec progress series state'.split():
+            self.assertFalse(key in track.__dict__)
+        self.assertEqual(track.bounds.speed.tuple(),
+                         (min(track.speed), max(track.speed)))
+        track.climb
+        self.assertFalse('progress' in track.__dict__)
+        self.assertFalse('tec' in track.bounds.__dict__)
+
+    def test_extend(self):
+        coords = sawtooth()
+        expected = Track(coords)
+        for used in (None, 's', 'bounds', 'speed', 'tec', 'state'):
+            track = Track(coords[:150])
+            if used:
+                getattr(track, used)
+            track.extend(coords[150:])
+            for key in self.keys.split():
+                self.assertEqual(getattr(track, key), getattr(expected, key))
+            self.assertEqual(track.bounds.__dict__.keys(),
+                             expected.bounds.__dict__.keys())
+            for key, bounds in track.bounds.__dict__.items():
+                self.assertEqual(bounds.tuple(),
+                                 expected.bounds.__dict__[key].tuple())
+
+
+class TestSummarise(unittest.TestCase):
+
+    def test_summarise(self):
+        coords = straight(300, dict((i, 1000 + (i * i) % 23) for i in
+                                    xrange(0, 300)))
+        track = Track(coords[:200])
+        track.summarise(slice(0, 10))
+        track.extend(coords[200:])
+        for start, stop in ((0, 1), (0, 299), (17, 18), (17, 250), (298, 299)):
+            summary = track.summarise(slice(start, stop))
+            dzs = [track.coords[i + 1].ele - track.coords[i].ele
+                   for i in xrange(start, stop)]
+            self.assertEqual(summary.dz_positive, sum(dz for dz in dzs
+                                                      if dz > 0))
+            self.assertEqual(summary.dz_negative, sum(dz for dz in dzs
+                                                      if dz < 0))
+            self.assertAlmostEqual(summary.distance,
+                                   track.s[stop] - track.s[start])
+            self.assertEqual(summary.climb.tuple(),
+                             (min(track.climb[start:stop]),
+                              max(track.climb[start:stop])))
+            self.assertEqual(summary.vs.tuple(),
+                             (float(min(dzs)), float(max(dzs))))
+
+
+class TestLevelsOfDetail(unittest.TestCase):
+
+    def coords(self):
+        dt = datetime.datetime(2008, 7, 1, 12, 0, 0)
+        return [Coord.deg(45.0 + 0.0001 * i, 6.0 + 0.0001 * (i % 2) * (i % 7),
+                          1000, dt + datetime.timedelta(seconds=i))
+                for i in xrange(0, 300)]
+
+    def test_nested(self):
+        track = Track(self.coords())
+        self.assertEqual(len(track.lod),
+                         len(igc2kmz.track.LOD_TOLERANCES) + 1)
+        self.assertEqual(track.lod[0], range(0, len(track.coords)))
+        for finer, coarser in zip(track.lod, track.lod[1:]):
+            self.assertEqual(coarser, sorted(coarser))
+            self.assertTrue(set(coarser) <= set(finer))
+            self.assertTrue(len(coarser) < len(finer))
+            self.assertEqual((coarser[0], coarser[-1]),
+                             (0, len(track.coords) - 1))
+
+    def test_extend(self):
+        coords = self.coords()
+        track = Track(coords[:200])
+        track.lod
+        track.extend(coords[200:])
+        self.assertEqual(track.lod, Track(coords).lod)
+
+
+class TestWindows(unittest.TestCase):
+
+    def check(self, coords):
+        track = Track(coords, windows=(5, 60))
+        self.assertEqual(sorted(track.series), [5, 60])
+        for window in (5, 60):
+            expected = Track(coords)
+            expected.analyse(window)
+            series = track.series[window]
+            for key in 'speed climb tec progress'.split():
+                self.assertEqual(getattr(series, key), getattr(expected, key))
+        extended = Track(coords[:200], windows=(5, 60))
+        extended.extend(coords[200:])
+        for window in (5, 60):
+            self.assertEqual(extended.series[window].__dict__,
+                             track.series[window].__dict__)
+
+    def test_windows(self):
+        self.check(sawtooth())
+
+    def test_numpy(self):
+        if igc2kmz.track.numpy is None:
+            return
+        numpy = igc2kmz.track.numpy
+        try:
+            igc2kmz.track.numpy = None
+            expected = Track(sawtooth(), windows=(5, 60))
+            expected.evaluate()
+        finally:
+            igc2kmz.track.numpy = numpy
+        track = Track(sawtooth(), windows=(5, 60))
+        for window in (5, 60):
+            self.assertEqual(track.series[window].__dict__,
+                             expected.series[window].__dict__)
+
+
+class TestNumpy(unittest.TestCase):
+
+    modules = (igc2kmz.geodesy, igc2kmz.track, igc2kmz.util)
+
+    def load(self):
+        filename = os.path.join(EXAMPLES, '858umbh1.igc')
+        track = IGC(open(filename)).track(windows=(5, 60))
+        track.evaluate()
+        return track
+
+    def test_analyse(self):
+        if igc2kmz.track.numpy is None:
+            return
+        numpy = igc2kmz.track.numpy
+        try:
+            for module in self.modules:
+                module.numpy = None
+            expected = self.load()
+        finally:
+            for module in self.modules:
+                module.numpy = numpy
+        track = self.load()
+        for key in 'speed climb tec progress state thermals glides'.split():
+            self.assertEqual(getattr(track, key), getattr(expected, key), key)
+        self.assertEqual(sorted(track.series), [5, 60])
+        for window in (5, 60):
+            self.assertEqual(track.series[window].__dict__,
+                             expected.series[window].__dict__)
+
+
+class TestTime(unittest.TestCase):
+
+    def test_utc(self):
+        tz = os.environ.get('TZ')
+        os.environ['TZ'] = 'Asia/Tokyo'
+        time.tzset()
+        try:
+            track = Track(straight(10))
+        finally:
+            if tz is None:
+                del os.environ['TZ']
+            else:
+                os.environ['TZ'] = tz
+            time.tzset()
+        self.assertEqual(track.t, range(1214913600, 1214913610))
+        self.assertEqual(track.bounds.time.tuple(),
+                         (1214913600.0, 1214913609.0))
+
+    def test_coord_at(self):
+        coords = straight(10)
+        track = Track(coords)
+        self.assertTrue(track.coord_at(1214913600 - 1) is coords[0])
+        self.assertTrue(track.coord_at(1214913603) is coords[3])
+        self.assertTrue(track.coord_at(1214913610) is coords[-1])
+        self.assertTrue(track.coord_at(1214913603.5) is coords[3])
+
+    def test_coords_at(self):
+        coords = straight(100)[::5]
+        track = Track(coords)
+        times = [1214913600 + 7 * i for i in xrange(-1, 16)]
+        expected = []
+        for t in times:
+            if t <= 1214913600:
+                expected.append(coords[0])
+            elif t >= 1214913695:
+                expected.append(coords[-1])
+            else:
+                i, r = divmod(t - 1214913600, 5)
+                expected.append(coords[i].interpolate(coords[i + 1],
+                                                      r / 5.0))
+        for times, expected in ((times, expected),
+                                (times[::-1], expected[::-1])):
+            result = track.coords_at(times)
+            self.assertEqual([(c.lat, c.lon, c.ele) for c in result],
+                             [(c.lat, c.lon, c.ele) for c in expected])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -17,13 +17,22 @@
 #   along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 
+import math
 import os.path
+import random
+import shutil
 import sys
+import tempfile
 import unittest
+import zipfile
 
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
 
-from igc2kmz.util import find_first_ge, salient, runs_where
+from igc2kmz.util import Bounds, FarthestPoints, HullTree, SparseTable, \
+        SwingTree, condense, condense_runs, douglas_peucker, find_first_ge, \
+        incr_douglas_peucker, mask_runs, open_inputs, run_edges, runs, \
+        runs_where, salient, salient2, strftime, time_floor, \
+        turning_points, visvalingam_whyatt, visvalingam_whyatt_ranking
 
 
 class TestFindFirstGE(unittest.TestCase):
@@ -131,6 +140,145 @@ class TestSalient(unittest.TestCase):
         self.assertEqual(salient([0,2,4,6,8,7,6,7,8,7], 3), [0, 9])
 
 
+def swings(seq, start, stop):
+    """Return the first largest fall and the first largest rise between start
+    and stop, inclusive, by scanning."""
+    result = []
+    for sign in (1, -1):
+        delta, left, right = 0, None, None
+        extreme = start
+        for i in xrange(start + 1, stop + 1):
+            if sign * seq[i] > sign * seq[extreme]:
+                extreme = i
+            elif sign * (seq[extreme] - seq[i]) > delta:
+                delta, left, right = sign * (seq[extreme] - seq[i]), extreme, i
+        result.append((delta, left, right))
+    return result
+
+
+def reference_salient2(seq, epsilons):
+    result = {0: 0, len(seq) - 1: 0}
+    stack = [(0, len(seq) - 1)]
+    while stack:
+        start, stop = stack.pop()
+        if stop - start < 2:
+            continue
+        fall, rise = swings(seq, start, stop)
+        delta, left, right = 0, start, stop
+        if seq[start] <= seq[stop] and fall[0] > 0:
+            delta, left, right = fall
+        if seq[start] >= seq[stop] and rise[0] > delta:
+            delta, left, right = rise
+        if delta >= epsilons[-1] and (left != start or right != stop):
+            for i, epsilon in enumerate(epsilons):
+                if delta >= epsilon:
+                    result[left] = min(result.get(left, i), i)
+                    result[right] = min(result.get(right, i), i)
+            stack.extend(((right, stop), (left, right), (start, left)))
+    return sorted(result.items())
+
+
+def reference_visvalingam_whyatt_ranking(x, y):
+    indexes = range(0, len(x))
+    removed = []
+    max_area = 0.0
+    while len(indexes) > 2:
+        areas = [abs((x[indexes[j - 1]] - x[indexes[j]])
+                     * (y[indexes[j + 1]] - y[indexes[j]])
+                     - (x[indexes[j + 1]] - x[indexes[j]])
+                     * (y[indexes[j - 1]] - y[indexes[j]])) / 2.0
+                 for j in xrange(1, len(indexes) - 1)]
+        j = min(xrange(0, len(areas)),
+                key=lambda j: (areas[j], indexes[j + 1]))
+        max_area = max(max_area, areas[j])
+        removed.append((indexes.pop(j + 1), max_area))
+    return [(i, float('inf')) for i in indexes] + removed[::-1]
+
+
+class TestVisvalingamWhyatt(unittest.TestCase):
+
+    def test_short(self):
+        self.assertEqual(visvalingam_whyatt_ranking([], []), [])
+        self.assertEqual(visvalingam_whyatt_ranking([0], [0]),
+                         [(0, float('inf'))])
+        self.assertEqual(visvalingam_whyatt([0, 1], [0, 0], 0), [0, 1])
+
+    def test_bump(self):
+        x = range(0, 7)
+        y = [0, 0, 0, 4, 0, 0, 1]
+        ranking = visvalingam_whyatt_ranking(x, y)
+        self.assertEqual([index for index, area in ranking[:3]], [0, 6, 3])
+        self.assertEqual(visvalingam_whyatt(x, y, 4.5), [0, 3, 6])
+        self.assertEqual(visvalingam_whyatt(x, y, 0.5), [0, 2, 3, 4, 6])
+        self.assertEqual(visvalingam_whyatt(x, y, 0, 3), [0, 3, 6])
+
+    def test_random(self):
+        random.seed(0)
+        for trial in xrange(0, 100):
+            n = random.randint(3, 40)
+            x = [random.randint(0, 5) for i in xrange(0, n)]
+            y = [random.randint(0, 5) for i in xrange(0, n)]
+            self.assertEqual(visvalingam_whyatt_ranking(x, y),
+                             reference_visvalingam_whyatt_ranking(x, y))
+
+    def test_budgets(self):
+        x, y = spiral(1000)
+        ranking = visvalingam_whyatt_ranking(x, y)
+        areas = [area for index, area in ranking]
+        self.assertEqual(areas, sorted(areas, reverse=True))
+        for k in (2, 10, 100, 1000):
+            indexes = visvalingam_whyatt(x, y, 0, k, ranking)
+            self.assertEqual(indexes, visvalingam_whyatt(x, y, 0, k))
+            self.assertEqual(indexes,
+                             sorted(index for index, area in ranking[:k]))
+        self.assertEqual(visvalingam_whyatt(x, y, 1.0, ranking=ranking),
+                         sorted(index for index, area in ranking
+                                if area > 1.0))
+
+
+class TestTurningPoints(unittest.TestCase):
+
+    def test_runs(self):
+        self.assertEqual(turning_points([0, 1, 2, 3, 3, 3, 2, 1, 1, 4]),
+                         [0, 3, 7, 9])
+
+    def test_short(self):
+        self.assertEqual(turning_points([]), [])
+        self.assertEqual(turning_points([5]), [0])
+        self.assertEqual(turning_points([5, 5]), [0, 1])
+
+
+class TestSwingTree(unittest.TestCase):
+
+    def test_random(self):
+        random.seed(0)
+        for trial in xrange(0, 1000):
+            n = random.randint(2, 40)
+            seq = [random.randint(0, random.choice((1, 3, 20)))
+                   for i in xrange(0, n)]
+            tree = SwingTree(seq)
+            start = random.randint(0, n - 2)
+            stop = random.randint(start + 1, n - 1)
+            node = tree.query(start, stop)
+            self.assertEqual([node[2:5], node[5:8]], swings(seq, start, stop))
+
+
+class TestSalient2(unittest.TestCase):
+
+    def test_random(self):
+        random.seed(0)
+        for trial in xrange(0, 200):
+            seq = [random.randint(0, 5)
+                   for i in xrange(0, random.randint(1, 60))]
+            self.assertEqual(sorted(salient2(seq, [4, 2, 1])),
+                             reference_salient2(seq, [4, 2, 1]))
+
+    def test_sawtooth(self):
+        seq = [i // 2 + 12 * (i % 20 < 10) for i in xrange(0, 5000)]
+        self.assertEqual(sorted(salient2(seq, [100, 50, 10])),
+                         reference_salient2(seq, [100, 50, 10]))
+
+
 class TestRunsWhere(unittest.TestCase):
 
     def test_1(self):
@@ -149,5 +297,177 @@ class TestRunsWhere(unittest.TestCase):
         self.assertEqual(list(runs_where([False, True])), [slice(1, 2)])
 
 
+class TestRunEdges(unittest.TestCase):
+
+    def edges(self, slices):
+        return ([sl.start for sl in slices], [sl.stop for sl in slices])
+
+    def test_empty(self):
+        self.assertEqual(run_edges([]), ([], []))
+        self.assertEqual(mask_runs([]), ([], []))
+        self.assertEqual(condense_runs([], [], [], 60), ([], []))
+
+    def test_random(self):
+        random.seed(0)
+        for n in (1, 2, 3, 10, 100, 1000):
+            values = [random.randrange(0, 3) for i in xrange(0, n)]
+            self.assertEqual(run_edges(values, 5),
+                             self.edges(list(runs(values, 5))))
+            mask = [value == 0 for value in values]
+            self.assertEqual(mask_runs(mask, 5),
+                             self.edges(list(runs_where(mask, 5))))
+            t = [random.uniform(0, 100) for i in xrange(0, n + 5)]
+            t.sort()
+            starts, stops = mask_runs(mask, 5)
+            self.assertEqual(condense_runs(starts, stops, t, 2.0),
+                             self.edges(list(condense(runs_where(mask, 5),
+                                                      t, 2.0))))
+
+
+class TestOpenInputs(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_zip(self):
+        filename = os.path.join(self.directory, 'flights.zip')
+        zf = zipfile.ZipFile(filename, 'w')
+        zf.writestr('day1/', '')
+        zf.writestr('day1/a.igc', 'A\n')
+        zf.writestr('day2/b.IGC', 'B\n')
+        zf.writestr('readme.txt', 'C\n')
+        zf.close()
+        self.assertEqual([(name, file.read()) for name, file
+                          in open_inputs(filename, ('.igc', '.gpx'))],
+                         [('day1/a.igc', 'A\n'), ('day2/b.IGC', 'B\n')])
+        self.assertEqual([name for name, file in open_inputs(filename)],
+                         ['day1/a.igc', 'day2/b.IGC', 'readme.txt'])
+
+
+class TestTimeFloor(unittest.TestCase):
+
+    def test_minutes(self):
+        t = 1214913600 + 17 * 60 + 42.5
+        self.assertEqual(time_floor(t, 300), 1214913600 + 15 * 60)
+        self.assertEqual(strftime('%H:%M:%S', t), '12:17:42')
+
+    def test_hours(self):
+        t = 1214913600 + 5 * 3600 + 1
+        self.assertEqual(time_floor(t, 3 * 3600), 1214913600 + 3 * 3600)
+
+
+class TestSparseTable(unittest.TestCase):
+
+    def check(self, values):
+        table = SparseTable(values)
+        for start in xrange(0, len(values)):
+            for stop in xrange(start + 1, len(values) + 1):
+                self.assertEqual(table.bounds(start, stop).tuple(),
+                                 Bounds(values[start:stop]).tuple())
+
+    def test_one(self):
+        self.check([1.0])
+
+    def test_random(self):
+        random.seed(0)
+        for n in (2, 3, 15, 16, 17, 33, 64, 100):
+            self.check([random.uniform(-5.0, 5.0) for i in xrange(0, n)])
+
+
+def farthest(x, y, left, right):
+    """Return the first point between left and right that is farthest from
+    the line through them."""
+    kx, ky = y[left] - y[right], x[right] - x[left]
+    c = x[left] * y[right] - x[right] * y[left]
+    dists = [abs(kx * x[i] + ky * y[i] + c) for i in xrange(left + 1, right)]
+    return left + 1 + dists.index(max(dists))
+
+
+def spiral(n, turn=60):
+    """Return the coordinates of n points of a drifting circle."""
+    x = [0.02 * i + 10.0 * math.cos(2 * math.pi * i / turn)
+         for i in xrange(0, n)]
+    y = [0.01 * i + 10.0 * math.sin(2 * math.pi * i / turn)
+         for i in xrange(0, n)]
+    return (x, y)
+
+
+def reference_douglas_peucker(x, y, epsilon):
+    indexes = set([0, len(x) - 1])
+    stack = [(0, len(x) - 1)]
+    while stack:
+        left, right = stack.pop()
+        if right - left < 2:
+            continue
+        pivot = farthest(x, y, left, right)
+        dist = abs((y[left] - y[right]) * x[pivot]
+                   + (x[right] - x[left]) * y[pivot]
+                   + x[left] * y[right] - x[right] * y[left]) \
+               / math.hypot(x[right] - x[left], y[right] - y[left])
+        if dist > epsilon:
+            indexes.add(pivot)
+            stack.append((left, pivot))
+            stack.append((pivot, right))
+    return sorted(indexes)
+
+
+class TestHullTree(unittest.TestCase):
+
+    def test_ties(self):
+        random.seed(0)
+        for trial in xrange(0, 500):
+            n = random.randint(3, 100)
+            x = [random.randint(0, 3) for i in xrange(0, n)]
+            y = [random.randint(0, 3) for i in xrange(0, n)]
+            tree = HullTree(x, y, random.choice((1, 2, 4)))
+            left = random.randint(0, n - 3)
+            right = random.randint(left + 2, n - 1)
+            kx, ky = y[left] - y[right], x[right] - x[left]
+            if ky == 0:
+                continue
+            c = x[left] * y[right] - x[right] * y[left]
+            candidates = tree.candidates(left + 1, right - 1, kx, ky)
+            dist = max(abs(kx * x[i] + ky * y[i] + c) for i in candidates)
+            pivot = min(i for i in candidates
+                        if abs(kx * x[i] + ky * y[i] + c) == dist)
+            self.assertEqual(pivot, farthest(x, y, left, right))
+
+
+class TestDouglasPeucker(unittest.TestCase):
+
+    def test_spiral(self):
+        x, y = spiral(3000)
+        self.assertEqual(douglas_peucker(x, y, 1.0),
+                         reference_douglas_peucker(x, y, 1.0))
+
+    def test_hull_tree(self):
+        x, y = spiral(3000)
+        expected = incr_douglas_peucker(x, y, 1.0, 450)
+        min_tree_length = FarthestPoints.min_tree_length
+        try:
+            FarthestPoints.min_tree_length = 0
+            self.assertEqual(douglas_peucker(x, y, 1.0),
+                             reference_douglas_peucker(x, y, 1.0))
+            self.assertEqual(incr_douglas_peucker(x, y, 1.0, 450), expected)
+        finally:
+            FarthestPoints.min_tree_length = min_tree_length
+
+    def test_random(self):
+        random.seed(0)
+        x = range(0, 2000)
+        y = [random.randint(0, 10) for i in x]
+        self.assertEqual(douglas_peucker(x, y, 0.5),
+                         reference_douglas_peucker(x, y, 0.5))
+
+    def test_max_indexes(self):
+        x, y = spiral(3000)
+        indexes = incr_douglas_peucker(x, y, 1.0, 450)
+        self.assertEqual(len(indexes), 450)
+        self.assertTrue(set(indexes) <= set(douglas_peucker(x, y, 1.0)))
+
+
 if __name__ == '__main__':
     unittest.main()